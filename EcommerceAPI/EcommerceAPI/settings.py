@@ -51,13 +51,14 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.AllowAny",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # JWTAuthentication without the user query, see api/authentication.py.
+        "api.authentication.ClaimsJWTAuthentication",
     ),
-    "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
-        "rest_framework.renderers.BrowsableAPIRenderer",
-    ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    # orjson when it's installed (see api/renderers.py). The browsable API only in development.
+    "DEFAULT_RENDERER_CLASSES": ["api.renderers.ORJSONRenderer"]
+    + (["rest_framework.renderers.BrowsableAPIRenderer"] if DEBUG else []),
+    # Page numbers, or keyset pages when the client sends ?cursor= (see api/pagination.py).
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.CursorOrPageNumberPagination",
     "PAGE_SIZE": 12,
 }
 
@@ -88,7 +89,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(seconds=3),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
     "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    # Checks the blacklist through an in-process Bloom filter, see api/tokens.py.
+    "TOKEN_REFRESH_SERIALIZER": "api.tokens.TokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -104,6 +106,8 @@ AUTH_USER_MODEL = "api.User"
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.middleware.CompressionMiddleware",
+    "api.middleware.QueryBudgetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -149,6 +153,43 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    }
+}
+
+# The version tokens that tell workers something changed (product cache, leaderboards, conditional GET stamps, users'
+# claims versions) are kept in the cache above. The local memory cache is one cache per worker: a change is only seen
+# by the worker that made it, the others find out when their tokens expire after CACHE_VERSION_TIMEOUT seconds. Run
+# more than one worker with a shared backend (Redis, Memcached), where tokens are kept until they're replaced.
+CACHE_VERSION_TIMEOUT = 60 if CACHES["default"]["BACKEND"].endswith("LocMemCache") else None
+
+# Number of serialized products each worker keeps in memory.
+PRODUCT_CACHE_SIZE = 5000
+LEADERBOARD_SIZE = 12  # products in each home page list
+LEADERBOARD_TIMEOUT = 3600  # seconds before a list is rebuilt from the database
+
+# Refresh token blacklist front (see api/tokens.py). Size the Bloom filter for the blacklisted tokens that haven't
+# expired yet, it stays at TOKEN_BLACKLIST_ERROR_RATE false positives up to TOKEN_BLACKLIST_CAPACITY tokens.
+TOKEN_BLACKLIST_CAPACITY = 1000000
+TOKEN_BLACKLIST_ERROR_RATE = 0.01
+TOKEN_BLACKLIST_LRU_SIZE = 10000
+# Without a shared cache, seconds between reads of the tokens other workers blacklisted. A token blacklisted by another
+# worker can be refreshed again within this window.
+TOKEN_BLACKLIST_SYNC_INTERVAL = 5
+TOKEN_BLACKLIST_REBUILD_INTERVAL = 6 * 3600  # seconds before the filter is rebuilt without the expired tokens
+
+# Moderator question queue (see api/moderation.py).
+QNA_LEASE = 600  # seconds a moderator holds the questions they claimed
+QNA_CLAIM_SIZE = 10  # questions claimed at once, unless the moderator asks for more (up to QNA_MAX_CLAIM_SIZE)
+QNA_MAX_CLAIM_SIZE = 50
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -193,3 +234,29 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # environment variables
 
 dotenv.load_dotenv()
+
+# Background tasks (see api/tasks.py). Set EMAIL_TRANSPORT=api.emails.StubTransport to keep emails in memory.
+EMAIL_TRANSPORT = os.environ.get("EMAIL_TRANSPORT", "api.emails.MailgunTransport")
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 30  # seconds, doubled after every failed attempt
+TASK_LEASE = 300  # seconds a worker may hold a task before another worker can take it over
+
+# Payment gateway (see api/payments.py). Set PAYMENT_GATEWAY=api.payments.FakeGateway to run checkouts offline.
+PAYMENT_GATEWAY = os.environ.get("PAYMENT_GATEWAY", "api.payments.SSLCommerzGateway")
+PAYMENT_GATEWAY_SANDBOX = True
+STORE_ID = os.environ.get("STORE_ID")
+STORE_PASSWD = os.environ.get("STORE_PASSWD")
+PAYMENT_GATEWAY_TIMEOUT = (3.05, 10)  # seconds to connect, seconds to wait for the response
+PAYMENT_GATEWAY_POOL_SIZE = 10
+PAYMENT_BREAKER_THRESHOLD = 5  # failures in a row before calls to the gateway are stopped
+PAYMENT_BREAKER_RESET = 30  # seconds before the gateway is tried again
+FAKE_GATEWAY_LATENCY = float(os.environ.get("FAKE_GATEWAY_LATENCY", 0))
+FAKE_GATEWAY_FAILURE_RATE = float(os.environ.get("FAKE_GATEWAY_FAILURE_RATE", 0))
+
+# Response compression (see api/middleware.py). Brotli needs the brotli package, gzip is used without it.
+COMPRESSION_MIN_SIZE = 1024  # bytes, smaller bodies are sent as they are
+COMPRESSION_BROTLI_QUALITY = 5  # 0-11, the top levels are too slow for responses built on every request
+
+# Per-request query budgets (see api/middleware.py). Strict mode raises instead of logging, for tests.
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT") == "True"
+QUERY_BUDGET_SERVER_TIMING = DEBUG
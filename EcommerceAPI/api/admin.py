@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, ProductImage, ProductSize, User, Order, OrderItem, WishList, QnA, EligibleReviewer, Review
+from .models import Category, Product, ProductImage, ProductSize, User, Order, OrderItem, WishList, QnA, EligibleReviewer, Review, Task
 # Register your models here.
 
 admin.site.register(Category)
@@ -13,3 +13,4 @@ admin.site.register(WishList)
 admin.site.register(QnA)
 admin.site.register(EligibleReviewer)
 admin.site.register(Review)
+admin.site.register(Task)
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .middleware import uncounted
+from .models import User
+
+# Access tokens already carry the user's id, username, email and roles (see MyTokenObtainPairSerializer), so
+# authentication builds request.user from them and only loads the User row if a view reads anything else (or hands
+# the user to the ORM). Tokens also carry the user's claims_version, which goes up whenever the user is saved (roles,
+# email, deactivation...). The current version of each user is kept in the cache; a token with an older version is
+# authenticated the usual way, from the database, until the user gets a new token. With the local memory cache
+# another worker's cached version expires after CACHE_VERSION_TIMEOUT.
+
+VERSION_KEY = "claims-version:{}"
+
+CLAIMS = ["username", "email", "first_name", "last_name", "is_moderator", "is_admin"]
+
+
+def get_claims_version(user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = (
+            User.objects.filter(id=user_id).values_list("claims_version", flat=True).first()
+        )
+        if version is not None:
+            cache.set(key, version, timeout=getattr(settings, "CACHE_VERSION_TIMEOUT", None))
+    return version
+
+
+def forget_claims_version(user_id):
+    transaction.on_commit(lambda: cache.delete(VERSION_KEY.format(user_id)))
+
+
+class ClaimsUser(SimpleLazyObject):
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(
+            lambda: User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        )
+        # Set directly, LazyObject would forward it to the (not yet loaded) user.
+        self.__dict__["token"] = token
+
+    def __bool__(self):
+        return True
+
+    # The claim holds the id as a string.
+    id = pk = property(
+        lambda self: User._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+    )
+    username = property(lambda self: self.token["username"])
+    email = property(lambda self: self.token["email"])
+    first_name = property(lambda self: self.token["first_name"])
+    last_name = property(lambda self: self.token["last_name"])
+    is_moderator = property(lambda self: self.token["is_moderator"])
+    is_admin = property(lambda self: self.token["is_admin"])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        # Not part of the view's query budget (see api/middleware.py).
+        with uncounted(request):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        version = validated_token.get("claims_version")
+        if (
+            user_id is None
+            or version is None
+            or any(claim not in validated_token for claim in CLAIMS)
+            or get_claims_version(user_id) != version
+        ):
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
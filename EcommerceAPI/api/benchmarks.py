@@ -0,0 +1,632 @@
+import io
+import json
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import moderation, sales, search
+from .renderers import ORJSONRenderer
+from .tokens import RefreshToken
+from .views import MyTokenObtainPairSerializer
+from .models import (
+    Category,
+    Product,
+    ProductSize,
+    User,
+    Order,
+    OrderItem,
+    QnA,
+    EligibleReviewer,
+    Review,
+)
+
+# Endpoint benchmarks. seed() fills the database with generated data (seed_benchmark_data command), run() replays a
+# request against every route of api/urls.py through the test client and measures it (run_benchmarks command).
+# Every request runs in a transaction that is rolled back, so write endpoints can be replayed without changing the
+# data the next request sees. Point the project at a separate database before seeding, this adds a lot of rows.
+#
+# Requests accept brotli and gzip like a browser, so the sizes are the body (json) and what went on the wire. The json
+# responses are also rendered again outside the request, with DRF's JSONRenderer and with ORJSONRenderer, to time the
+# serialization alone.
+
+BENCHMARK_PASSWORD = "benchmark-password"
+ACCEPT_ENCODING = "br, gzip"
+RENDER_ITERATIONS = 20
+SIZES = ["S", "M", "L", "XL"]
+WORDS = (
+    "red blue green black white navy grey cotton linen silk denim shirt pant slipper payjama panjabi kurta "
+    "jacket hoodie summer winter classic slim regular printed striped plain soft casual formal"
+).split()
+
+
+def bulk_create(model, rows, chunk_size):
+    for start in range(0, len(rows), chunk_size):
+        model.objects.bulk_create(rows[start : start + chunk_size])
+
+
+def seed(
+    users=1000,
+    categories=10,
+    products=10000,
+    orders=5000,
+    items_per_order=3,
+    reviews=5000,
+    questions=5000,
+    tokens=0,
+    chunk_size=2000,
+    log=print,
+):
+    # Names carry a run tag so seeding twice doesn't clash with the unique slugs, usernames and emails.
+    tag = uuid.uuid4().hex[:6]
+    password = make_password(BENCHMARK_PASSWORD)
+
+    User.objects.create(
+        username=f"bench-admin-{tag}",
+        email=f"bench-admin-{tag}@example.com",
+        password=password,
+        first_name="Bench",
+        last_name="Admin",
+        is_admin=True,
+    )
+    bulk_create(
+        User,
+        [
+            User(
+                username=f"bench.user.{tag}.{i}",
+                email=f"bench.user.{tag}.{i}@example.com",
+                password=password,
+                first_name="Bench",
+                last_name=f"User {i}",
+                phone="01700000000",
+                address="Comilla",
+            )
+            for i in range(users)
+        ],
+        chunk_size,
+    )
+    users = list(
+        User.objects.filter(username__startswith=f"bench.user.{tag}.").values_list("id", "username")
+    )
+    user_ids = [user_id for user_id, _ in users]
+    log(f"{len(users)} users")
+
+    bulk_create(
+        Category,
+        [
+            Category(name=f"Bench category {tag} {i}", slug=slugify(f"Bench category {tag} {i}"))
+            for i in range(categories)
+        ],
+        chunk_size,
+    )
+    category_ids = list(
+        Category.objects.filter(slug__startswith=f"bench-category-{tag}-").values_list("id", flat=True)
+    )
+    log(f"{categories} categories")
+
+    for start in range(0, products, chunk_size):
+        rows = []
+        for i in range(start, min(start + chunk_size, products)):
+            name = f"{' '.join(random.sample(WORDS, 3))} {tag} {i}"
+            rows.append(
+                Product(
+                    name=name,
+                    slug=slugify(name),
+                    category_id=random.choice(category_ids),
+                    description=" ".join(random.choices(WORDS, k=60)),
+                    regular_price=random.randint(200, 3000),
+                    discount_price=random.choice([None, random.randint(100, 200)]),
+                    stock=len(SIZES) * 1000,
+                    sold=random.randint(0, 500),
+                )
+            )
+        Product.objects.bulk_create(rows)
+    product_ids = list(
+        Product.objects.filter(slug__contains=f"-{tag}-").values_list("id", flat=True)
+    )
+    bulk_create(
+        ProductSize,
+        [
+            ProductSize(product_id=product_id, size=size, available_quantity=1000)
+            for product_id in product_ids
+            for size in SIZES
+        ],
+        chunk_size,
+    )
+    log(f"{products} products, {products * len(SIZES)} sizes")
+
+    for start in range(0, orders, chunk_size):
+        rows = []
+        for user_id, username in random.choices(users, k=min(chunk_size, orders - start)):
+            # bulk_create doesn't call save, which sets pending.
+            status = random.choice(["Pending", "Confirmed", "Shipped", "Delivered"])
+            rows.append(
+                Order(
+                    user_id=user_id,
+                    username=username,
+                    first_name="Bench",
+                    last_name="User",
+                    email="bench@example.com",
+                    status=status,
+                    pending=status == "Pending",
+                    payment_method="COD",
+                    total=random.randint(200, 10000),
+                )
+            )
+        Order.objects.bulk_create(rows)
+    order_ids = list(
+        Order.objects.filter(username__startswith=f"bench.user.{tag}.").values_list("id", flat=True)
+    )
+    bulk_create(
+        OrderItem,
+        [
+            OrderItem(
+                order_id=order_id,
+                product_id=random.choice(product_ids),
+                quantity=random.randint(1, 3),
+                size=random.choice(SIZES),
+                price=random.randint(200, 3000),
+            )
+            for order_id in order_ids
+            for _ in range(items_per_order)
+        ],
+        chunk_size,
+    )
+    log(f"{orders} orders, {orders * items_per_order} order items")
+
+    bulk_create(
+        Review,
+        [
+            Review(
+                user_id=random.choice(user_ids),
+                product_id=random.choice(product_ids),
+                rating=random.randint(1, 5),
+                review=" ".join(random.choices(WORDS, k=20)),
+            )
+            for _ in range(reviews)
+        ],
+        chunk_size,
+    )
+    bulk_create(
+        QnA,
+        [
+            QnA(
+                user_id=random.choice(user_ids),
+                product_id=random.choice(product_ids),
+                question=" ".join(random.choices(WORDS, k=10)) + "?",
+                answer=random.choice([None, "", "Yes."]),
+            )
+            for _ in range(questions)
+        ],
+        chunk_size,
+    )
+    log(f"{reviews} reviews, {questions} questions")
+
+    # Refresh tokens as token rotation leaves them: most blacklisted, about half already expired.
+    now = timezone.now()
+    lifetime = settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"]
+    for start in range(0, tokens, chunk_size):
+        count = min(chunk_size, tokens - start)
+        outstanding = OutstandingToken.objects.bulk_create(
+            [
+                OutstandingToken(
+                    user_id=random.choice(user_ids),
+                    jti=uuid.uuid4().hex,
+                    token="benchmark",
+                    created_at=now - lifetime * 2 * ((tokens - start - i) / tokens),
+                    expires_at=now - lifetime * 2 * ((tokens - start - i) / tokens) + lifetime,
+                )
+                for i in range(count)
+            ]
+        )
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(token=token) for token in outstanding if random.random() < 0.9]
+        )
+    if tokens:
+        log(f"{tokens} refresh tokens")
+
+    search.rebuild_index(chunk_size=chunk_size)
+    log("search index rebuilt")
+    sales.rebuild_sales(chunk_size=chunk_size, log=lambda message: None)
+    log("sales totals rebuilt")
+    moderation.repair_unanswered_count()
+
+
+def get_context():
+    # Sample rows the scenarios point at. The customer is the one who placed the order.
+    admin = User.objects.filter(is_admin=True).order_by("-id").first()
+    product = Product.objects.filter(productsize__isnull=False).order_by("-id").first()
+    order = Order.objects.filter(user_id__isnull=False).order_by("-id").first()
+    if admin is None or product is None or order is None:
+        raise ValueError("Seed the database first (manage.py seed_benchmark_data).")
+
+    customer = User.objects.get(id=order.user_id)
+    qna = QnA.objects.order_by("-id").first()
+    return {
+        "admin": admin,
+        "customer": customer,
+        "product": product,
+        "category": product.category,
+        "order": order,
+        "qna": qna,
+        "size": ProductSize.objects.filter(product=product).first().size,
+    }
+
+
+def order_payload(ctx, payment_method="COD"):
+    product = ctx["product"]
+    return {
+        "order": {
+            "first_name": "Bench",
+            "last_name": "User",
+            "email": "bench@example.com",
+            "phone": "01700000000",
+            "address": "Comilla",
+            "username": ctx["customer"].username,
+        },
+        "shipping_charge": 60,
+        "payment_method": payment_method,
+        "outside_comilla": False,
+        "order_items": [
+            {
+                "productData": {
+                    "id": product.id,
+                    "regular_price": product.regular_price,
+                    "discount_price": product.discount_price,
+                },
+                "quantity": 1,
+                "size": [{"size": ctx["size"]}],
+            }
+        ],
+    }
+
+
+def online_order(ctx):
+    # payment callbacks look the order up by its transaction id.
+    order = Order.objects.create(
+        username=ctx["customer"].username,
+        payment_method="online",
+        transaction_id=uuid.uuid4().hex,
+    )
+    OrderItem.objects.create(
+        order=order,
+        product=ctx["product"],
+        quantity=1,
+        size=ctx["size"],
+        price=ctx["product"].regular_price,
+    )
+    return {"tran_id": order.transaction_id, "val_id": "benchmark"}
+
+
+def eligible_review(ctx):
+    EligibleReviewer.objects.get_or_create(
+        user=ctx["customer"], product=ctx["product"], order=ctx["order"]
+    )
+    return {"review": "Benchmark review.", "rating": 4}
+
+
+def claimed_answers(ctx):
+    questions, _ = moderation.claim(ctx["admin"], 5)
+    return {"answers": [{"id": qna.id, "answer": "Yes."} for qna in questions]}
+
+
+def image_upload(ctx):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 800), "red").save(buffer, "JPEG")
+    buffer.name = "benchmark.jpg"
+    buffer.seek(0)
+    return {"images": [buffer]}
+
+
+# name, method, path, user, data. path is formatted with the context, data may be a function of the context.
+SCENARIOS = [
+    ("category", "get", "category/{category.slug}/", None, None),
+    ("product", "get", "product/{product.slug}/", None, None),
+    ("is_name_unique", "get", "is_name_unique/{product.slug}/", None, None),
+    ("similar_products", "get", "similar_products/{category.slug}/", None, None),
+    ("get_availability", "get", "availability/?ids={product.id}", None, None),
+    ("get_available_sizes", "get", "get_available_sizes/{product.id}/", None, None),
+    ("get_size_specific_stock", "get", "get_size_specific_stock/{product.id}/{size}/", None, None),
+    ("get_categories", "get", "get_categories/", None, None),
+    ("get_top_products", "get", "get_top_products/", None, None),
+    ("delete_product", "delete", "delete_product/{product.slug}/", "admin", None),
+    ("images", "get", "images/{product.id}/", None, None),
+    ("upload_images", "post", "upload_images/{product.id}/", "admin", image_upload),
+    ("token", "post", "token/", None, lambda ctx: {"email": ctx["customer"].email, "password": BENCHMARK_PASSWORD}),
+    ("token_refresh", "post", "token/refresh/", None, lambda ctx: {"refresh": str(RefreshToken.for_user(ctx["customer"]))}),
+    (
+        "register",
+        "post",
+        "register/user/",
+        None,
+        lambda ctx: {
+            "first_name": "Md",
+            "last_name": "Rahman",
+            "email": f"{uuid.uuid4().hex}@example.com",
+            "phone": "01700000000",
+            "address": "Comilla",
+            "password": BENCHMARK_PASSWORD,
+        },
+    ),
+    ("place_order", "post", "place_order/", "customer", order_payload),
+    ("orders", "get", "orders/", "admin", None),
+    ("get_order_items", "get", "get_order_items/{order.id}/", "admin", None),
+    ("export_orders", "get", "export_orders/?status=Pending", "admin", None),
+    ("change_order_status", "post", "change_order_status/{order.id}/", "admin", {"status": "Shipped"}),
+    ("sales", "get", "analytics/sales/?by=product", "admin", None),
+    ("get_user_data", "get", "get_user_data/{customer.id}/", "customer", None),
+    (
+        "add_product_sizes",
+        "post",
+        "add_product_sizes/{product.id}/",
+        "admin",
+        {"stock": 20, "sizes": [{"size": "M", "available_quantity": 10}, {"size": "L", "available_quantity": 10}]},
+    ),
+    (
+        "edit_account",
+        "post",
+        "edit_account/{customer.id}",
+        "customer",
+        lambda ctx: {
+            "first_name": "Bench",
+            "last_name": "User",
+            "email": ctx["customer"].email,
+            "phone": "01700000000",
+            "address": "Comilla",
+        },
+    ),
+    ("search", "get", "search/?query=cotton%20shi", None, None),
+    ("wishlist", "get", "wishlist/", "customer", None),
+    ("change_wishlist", "post", "change_wishlist/{product.slug}/", "customer", None),
+    ("if_in_wishlist", "get", "if_in_wishlist/{product.slug}/", "customer", None),
+    ("wishlist_membership", "get", "wishlist/contains/?slugs={product.slug}", "customer", None),
+    ("wishlist_item", "put", "wishlist/items/{product.id}/", "customer", None),
+    ("qna", "get", "qna/{product.slug}/", None, None),
+    ("add_question", "post", "add_question/{product.slug}/", "customer", {"question": "Is it cotton?"}),
+    ("add_answer", "post", "add_answer/{qna.id}/", "admin", {"answer": "Yes."}),
+    ("unanswered_questions", "get", "unanswered_questions/", "admin", None),
+    ("qna_queue", "get", "qna_queue/", "admin", None),
+    ("claim_questions", "post", "qna_queue/claim/", "admin", {"size": 10}),
+    ("answer_questions", "post", "qna_queue/answer/", "admin", claimed_answers),
+    ("new_arrivals", "get", "new_arrivals/", None, None),
+    ("get_user_orders", "get", "get_user_orders/", "customer", None),
+    ("get_moderators", "get", "get_moderators/", "admin", None),
+    ("change_moderator_status", "put", "change_moderator_status/{customer.id}/", "admin", None),
+    ("get_users", "get", "get_users/bench/", "admin", None),
+    ("change_pass_test", "post", "change_pass_test/", "customer", {"new_pass": BENCHMARK_PASSWORD}),
+    ("get_reviews", "get", "get_reviews/{product.slug}/", None, None),
+    ("create_review", "post", "create_review/{product.slug}/", "customer", eligible_review),
+    ("is_eligible_reviewer", "get", "is_eligible_reviewer/{product.slug}/", "customer", None),
+    ("payment_success", "post", "payment/success/", None, online_order),
+    ("payment_fail", "post", "payment/fail/", None, online_order),
+    ("payment_cancel", "post", "payment/cancel/", None, online_order),
+    ("payment_metrics", "get", "payment/metrics/", "admin", None),
+    (
+        "edit_product",
+        "post",
+        "edit_product/{product.slug}/",
+        "admin",
+        lambda ctx: {
+            "product": {
+                "name": ctx["product"].name,
+                "description": ctx["product"].description,
+                "regular_price": ctx["product"].regular_price,
+                "stock": ctx["product"].stock,
+            },
+            "category": {"category": {"id": ctx["category"].id}},
+        },
+    ),
+]
+
+
+class ScenarioError(Exception):
+    pass
+
+
+def check_status(name, response):
+    # A scenario that fails (bad data, a harness that can't reach the view) only measures the error path.
+    if not 200 <= response.status_code < 400:
+        raise ScenarioError(
+            f"{name} returned {response.status_code}: {response.content[:200]!r}"
+        )
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def request(client, method, path, data, ctx):
+    # Returns the response and how long it took. The scenario's rows are created in the same rolled back
+    # transaction, outside the timing. Multipart for uploads and the payment callbacks (form posts), json otherwise.
+    # Nothing is committed, so the work the view leaves for after the commit (sales totals, leaderboards, cache
+    # versions) is run before the rollback, in the timing, as it would run in the request.
+    with transaction.atomic():
+        payload = data(ctx) if callable(data) else data
+        multipart = isinstance(payload, dict) and ("images" in payload or "tran_id" in payload)
+        start = time.perf_counter()
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            if payload is None:
+                response = getattr(client, method)(path)
+            elif multipart:
+                response = getattr(client, method)(path, payload, format="multipart")
+            else:
+                response = getattr(client, method)(path, payload, format="json")
+            if response.streaming:
+                # A streamed body is built as it's read, read it here so it's timed and its queries counted.
+                response.streaming_content = [b"".join(response.streaming_content)]
+        elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return response, elapsed
+
+
+def get_client(ctx, role):
+    # Signed in with a real access token, so authentication runs like it does for the app's clients.
+    client = APIClient(HTTP_ACCEPT_ENCODING=ACCEPT_ENCODING)
+    if role is not None:
+        token = MyTokenObtainPairSerializer.get_token(ctx[role]).access_token
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+    return client
+
+
+def run_scenario(ctx, scenario, iterations):
+    name, method, path, role, data = scenario
+    client = get_client(ctx, role)
+    path = "/api/" + path.format(**ctx)
+
+    latencies = []
+    status_code = None
+    for _ in range(iterations):
+        response, elapsed = request(client, method, path, data, ctx)
+        check_status(name, response)
+        latencies.append(elapsed)
+        status_code = response.status_code
+
+    # One more request to count queries and measure memory, kept out of the latencies.
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        response, _ = request(client, method, path, data, ctx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "method": method.upper(),
+        "path": path,
+        "status": status_code,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "queries": len(queries.captured_queries),
+        "peak_memory_kb": round(peak / 1024, 1),
+        **measure_rendering(response),
+    }
+
+
+def time_render(renderer, data, iterations=RENDER_ITERATIONS):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = renderer.render(data)
+    return body, (time.perf_counter() - start) / iterations
+
+
+def measure_rendering(response):
+    wire_bytes = len(b"".join(response.streaming_content) if response.streaming else response.content)
+    data = getattr(response, "data", None)
+    if data is None or not response.get("Content-Type", "").startswith("application/json"):
+        return {"wire_kb": round(wire_bytes / 1024, 1)}
+
+    body, json_seconds = time_render(JSONRenderer(), data)
+    _, orjson_seconds = time_render(ORJSONRenderer(), data)
+    return {
+        "body_kb": round(len(body) / 1024, 1),
+        "wire_kb": round(wire_bytes / 1024, 1),
+        "encoding": response.get("Content-Encoding"),
+        "json_render_ms": round(json_seconds * 1000, 3),
+        "orjson_render_ms": round(orjson_seconds * 1000, 3),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def isolated():
+    # The test client's host is allowed, emails stay in memory, the payment gateway is faked and uploads go to a
+    # throwaway folder.
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        ALLOWED_HOSTS=["testserver"],
+        MEDIA_ROOT=media_root,
+        EMAIL_TRANSPORT="api.emails.StubTransport",
+        PAYMENT_GATEWAY="api.payments.FakeGateway",
+        FAKE_GATEWAY_LATENCY=0,
+        FAKE_GATEWAY_FAILURE_RATE=0,
+    ):
+        yield
+
+
+def get_scenarios(only=None):
+    return [scenario for scenario in SCENARIOS if not only or scenario[0] in only]
+
+
+def format_sizes(result):
+    if "body_kb" not in result:
+        return ""
+    return (
+        f"  {result['body_kb']:>7.1f}KB -> {result['wire_kb']:>6.1f}KB {result['encoding'] or '':<4}"
+        f"  render {result['json_render_ms']:>6.3f}ms -> {result['orjson_render_ms']:>6.3f}ms"
+    )
+
+
+def run(iterations=20, only=None, log=print):
+    ctx = get_context()
+    results = {}
+    with isolated():
+        for scenario in get_scenarios(only):
+            results[scenario[0]] = result = run_scenario(ctx, scenario, iterations)
+            log(
+                f"{scenario[0]:<24} {result['status']:>3}  p50 {result['p50_ms']:>8.2f}ms  "
+                f"p95 {result['p95_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  "
+                f"{result['queries']:>3} queries  {result['peak_memory_kb']:>9.1f}KB"
+                f"{format_sizes(result)}"
+            )
+
+    return {
+        "commit": get_commit(),
+        "date": timezone.now().isoformat(),
+        "database": connection.vendor,
+        "iterations": iterations,
+        "rows": {
+            model.__name__: model.objects.count()
+            for model in (User, Category, Product, ProductSize, Order, OrderItem, Review, QnA)
+        },
+        "endpoints": results,
+    }
+
+
+def compare(previous, current, log=print):
+    for name, result in current["endpoints"].items():
+        before = previous["endpoints"].get(name)
+        if before is None:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+        log(
+            f"{name:<24} p95 {before['p95_ms']:>8.2f}ms -> {result['p95_ms']:>8.2f}ms ({change:+.0f}%)  "
+            f"queries {before['queries']} -> {result['queries']}"
+            + (f"  wire {before['wire_kb']}KB -> {result['wire_kb']}KB" if "wire_kb" in before else "")
+        )
+
+
+def save(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
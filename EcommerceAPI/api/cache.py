@@ -0,0 +1,127 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import conditional
+from .models import Product
+from .serializers import ProductSerializer
+
+# Serialized products (the output of ProductSerializer) are kept in a per-process LRU. Every product also has a
+# version token stored in Django's cache; a change to the product, its category or its images gives it a new token,
+# so the old fragment is never looked up again and just ages out of the LRU. With a shared cache backend the new
+# token is seen by every worker; with the local memory cache tokens expire after CACHE_VERSION_TIMEOUT, so another
+# worker's fragment is at most that old.
+
+VERSION_KEY = "product-version:{}"
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.data:
+                    self.data.move_to_end(key)
+                    found[key] = self.data[key]
+        return found
+
+    def set_many(self, items):
+        with self.lock:
+            for key, value in items.items():
+                self.data[key] = value
+                self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def get_version_timeout():
+    # None (kept until replaced) with a shared cache, see CACHE_VERSION_TIMEOUT in settings.
+    return getattr(settings, "CACHE_VERSION_TIMEOUT", None)
+
+
+product_fragments = LRUCache(getattr(settings, "PRODUCT_CACHE_SIZE", 5000))
+
+
+def get_product_versions(product_ids):
+    keys = {VERSION_KEY.format(product_id): product_id for product_id in product_ids}
+    versions = cache.get_many(keys)
+
+    # A product without a token (never changed, or its token was evicted) gets a fresh one, so a fragment cached
+    # before an eviction can't be served again.
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, timeout=get_version_timeout())
+        versions.update(cache.get_many(missing))
+
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+
+    # Wait for the commit, otherwise a concurrent read could cache the old row under the new token. The product's
+    # conditional GET stamp (api/conditional.py) changes with it.
+    transaction.on_commit(
+        lambda: cache.set_many(
+            {
+                **{
+                    VERSION_KEY.format(product_id): uuid.uuid4().hex
+                    for product_id in product_ids
+                },
+                **{
+                    conditional.get_key(f"product:{product_id}"): conditional.new_stamp()
+                    for product_id in product_ids
+                },
+            },
+            timeout=get_version_timeout(),
+        )
+    )
+
+
+def invalidate_category(category_id):
+    invalidate_products(
+        Product.objects.filter(category_id=category_id).values_list("id", flat=True)
+    )
+
+
+def serialize_products(product_ids, request=None):
+    # Returns ProductSerializer data for product_ids, in the same order, loading only the products that aren't
+    # cached yet. The returned dicts are shared with the cache and must not be modified.
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+
+    # Image urls are absolute, so fragments are cached per host.
+    base_url = request.build_absolute_uri("/") if request is not None else ""
+    versions = get_product_versions(product_ids)
+    keys = {
+        product_id: (product_id, versions.get(product_id), base_url)
+        for product_id in product_ids
+    }
+    fragments = product_fragments.get_many(keys.values())
+
+    missing = [product_id for product_id in product_ids if keys[product_id] not in fragments]
+    if missing:
+        products = ProductSerializer.setup_eager_loading(Product.objects.filter(id__in=missing))
+        data = ProductSerializer(products, many=True, context={"request": request}).data
+        loaded = {keys[item["id"]]: item for item in data}
+        product_fragments.set_many(loaded)
+        fragments.update(loaded)
+
+    return [fragments[keys[product_id]] for product_id in product_ids if keys[product_id] in fragments]
@@ -0,0 +1,265 @@
+import csv
+import json
+from itertools import islice
+
+from django.db import reset_queries, transaction
+from django.utils.text import slugify
+
+from . import conditional, leaderboards, search
+from .cache import invalidate_products
+from .models import Category, Product, ProductSize
+
+# Bulk catalog import and export (import_catalog / export_catalog commands). A catalog is one product per CSV row or
+# JSONL line. Files are read and written a chunk of products at a time, so memory doesn't grow with the file, and each
+# chunk costs a handful of bulk queries. Products are matched by slug (slugify(name), as Product.save does) and
+# categories by name, so importing the same file twice changes nothing. The sizes in the file replace the product's
+# sizes and its stock becomes their total, as in add_product_sizes.
+#
+# CSV sizes are written "S:10;M:5", JSONL sizes are an object ({"S": 10, "M": 5}).
+
+FIELDS = [
+    "name",
+    "category",
+    "description",
+    "regular_price",
+    "discount_price",
+    "stock",
+    "sizes",
+    "intro_image",
+]
+
+PRODUCT_FIELDS = [
+    "name",
+    "category",
+    "description",
+    "regular_price",
+    "discount_price",
+    "stock",
+    "intro_image",
+]
+
+# bulk_update builds a CASE per field with one WHEN per object, keep the statements small.
+BATCH_SIZE = 500
+
+
+class CatalogError(Exception):
+    pass
+
+
+def read_rows(file, file_format):
+    # Yields (row number, row). CSV sizes are left as they are in the file, clean_row parses them.
+    if file_format == "csv":
+        yield from enumerate(csv.DictReader(file), 1)
+    else:
+        number = 0
+        for line in file:
+            if line.strip():
+                number += 1
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise CatalogError(f"Row {number}: {e}")
+
+
+def parse_sizes(value):
+    sizes = {}
+    for item in value.split(";"):
+        if item.strip():
+            size, _, quantity = item.partition(":")
+            if not size.strip() or not quantity.strip():
+                raise ValueError(f"sizes must be written SIZE:QUANTITY, got {item!r}")
+            sizes[size.strip()] = int(quantity)
+    return sizes
+
+
+def format_sizes(sizes):
+    return ";".join(f"{size}:{quantity}" for size, quantity in sizes.items())
+
+
+def chunks(rows, chunk_size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def clean_row(row, number):
+    try:
+        name = row["name"].strip()
+        category = row["category"].strip()
+        if not name or not category:
+            raise ValueError("name and category are required")
+        sizes = row.get("sizes") or {}
+        if isinstance(sizes, str):
+            sizes = parse_sizes(sizes)
+        sizes = {str(size): int(quantity) for size, quantity in sizes.items()}
+        discount_price = row.get("discount_price")
+        return {
+            "name": name,
+            "slug": slugify(name),
+            "category": category,
+            "description": row.get("description") or "",
+            "regular_price": float(row["regular_price"]),
+            "discount_price": float(discount_price) if discount_price not in (None, "") else None,
+            "stock": sum(sizes.values()) if sizes else int(row.get("stock") or 0),
+            "sizes": sizes,
+            "intro_image": row.get("intro_image") or "",
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        raise CatalogError(f"Row {number}: {e}")
+
+
+def get_categories(names):
+    # Missing categories are created, with their slug set like Category.save does.
+    slugs = {name: slugify(name) for name in names}
+    categories = {category.slug: category for category in Category.objects.filter(slug__in=slugs.values())}
+    missing = {slug: name for name, slug in slugs.items() if slug not in categories}
+    if missing:
+        Category.objects.bulk_create([Category(name=name, slug=slug) for slug, name in missing.items()])
+        conditional.touch("categories")
+        categories.update(
+            {category.slug: category for category in Category.objects.filter(slug__in=missing)}
+        )
+    return {name: categories[slug] for name, slug in slugs.items()}
+
+
+def import_chunk(rows):
+    # Later rows win over earlier ones with the same slug.
+    rows = list({row["slug"]: row for row in rows}.values())
+    categories = get_categories({row["category"] for row in rows})
+    existing = {
+        product.slug: product
+        for product in Product.objects.filter(slug__in=[row["slug"] for row in rows]).only(
+            "slug", *PRODUCT_FIELDS
+        )
+    }
+
+    products = []
+    created = []
+    updated = []
+    for row in rows:
+        product = Product(
+            name=row["name"],
+            slug=row["slug"],
+            category=categories[row["category"]],
+            description=row["description"],
+            regular_price=row["regular_price"],
+            discount_price=row["discount_price"],
+            stock=row["stock"],
+            intro_image=row["intro_image"],
+        )
+        products.append(product)
+        current = existing.get(row["slug"])
+        if current is None:
+            created.append(product)
+            continue
+        product.id = current.id
+        # Unchanged products are left alone, re-importing a catalog mostly changes prices and stock. Values are
+        # compared as they'd be saved: an empty intro_image is None on a product without one and "" in the file.
+        if any(
+            field.get_prep_value(getattr(product, field.attname))
+            != field.get_prep_value(getattr(current, field.attname))
+            for field in map(Product._meta.get_field, PRODUCT_FIELDS)
+        ):
+            updated.append(product)
+
+    Product.objects.bulk_create(created)
+    Product.objects.bulk_update(updated, PRODUCT_FIELDS, batch_size=BATCH_SIZE)
+    ids = dict(Product.objects.filter(slug__in=[row["slug"] for row in rows]).values_list("slug", "id"))
+    for product in products:
+        product.id = ids[product.slug]
+
+    # Sizes: update the ones that exist, create the new ones, delete the ones that aren't in the file anymore.
+    current = {
+        (size.product_id, size.size): size
+        for size in ProductSize.objects.filter(product_id__in=ids.values())
+    }
+    wanted = {
+        (ids[row["slug"]], size): quantity
+        for row in rows
+        for size, quantity in row["sizes"].items()
+    }
+    changed = []
+    for key, quantity in wanted.items():
+        if key in current and current[key].available_quantity != quantity:
+            current[key].available_quantity = quantity
+            changed.append(current[key])
+    new_sizes = [
+        ProductSize(product_id=product_id, size=size, available_quantity=quantity)
+        for (product_id, size), quantity in wanted.items()
+        if (product_id, size) not in current
+    ]
+    removed = [size for key, size in current.items() if key not in wanted]
+    ProductSize.objects.bulk_update(changed, ["available_quantity"], batch_size=BATCH_SIZE)
+    if new_sizes:
+        ProductSize.objects.bulk_create(new_sizes)
+    if removed:
+        ProductSize.objects.filter(id__in=[size.id for size in removed]).delete()
+
+    # Bulk queries don't send signals, keep the search index and the product cache up to date here, for the products
+    # that changed.
+    search.index_products(created + updated)
+    invalidate_products(
+        {product.id for product in created + updated}
+        | {size.product_id for size in changed + new_sizes + removed}
+    )
+    return len(rows), len(created), len(updated)
+
+
+def import_catalog(file, file_format="csv", chunk_size=2000, log=print):
+    # Each chunk is its own transaction. If a row is invalid the chunks before it stay imported; fix the file and
+    # import it again.
+    total = created = updated = 0
+    rows = (clean_row(row, number) for number, row in read_rows(file, file_format))
+    for chunk in chunks(rows, chunk_size):
+        with transaction.atomic():
+            count, new, changed = import_chunk(chunk)
+        total += count
+        created += new
+        updated += changed
+        log(f"{total} products imported")
+        # With DEBUG on, the query log would keep every chunk's queries.
+        reset_queries()
+
+    leaderboards.invalidate()
+    return total, created, updated
+
+
+def export_rows(chunk_size=2000):
+    products = (
+        Product.objects.select_related("category")
+        .prefetch_related("productsize_set")
+        .order_by("id")
+        .iterator(chunk_size=chunk_size)
+    )
+    for number, product in enumerate(products, 1):
+        if number % chunk_size == 0:
+            reset_queries()
+        yield {
+            "name": product.name,
+            "category": product.category.name,
+            "description": product.description,
+            "regular_price": product.regular_price,
+            "discount_price": product.discount_price,
+            "stock": product.stock,
+            "sizes": {size.size: size.available_quantity for size in product.productsize_set.all()},
+            "intro_image": product.intro_image.name or "",
+        }
+
+
+def export_catalog(file, file_format="csv", chunk_size=2000):
+    count = 0
+    if file_format == "csv":
+        writer = csv.DictWriter(file, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in export_rows(chunk_size):
+            row["sizes"] = format_sizes(row["sizes"])
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in export_rows(chunk_size):
+            file.write(json.dumps(row) + "\n")
+            count += 1
+    return count
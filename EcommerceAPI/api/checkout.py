@@ -0,0 +1,119 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404
+
+from .models import Product, ProductSize, OrderItem, EligibleReviewer
+from .stock import StockLine, reduce_stock
+
+# Checkout works on the whole cart at once: every product and size referenced by the cart is loaded up front
+# (one query each), the cart is validated in memory and the order rows are written with bulk_create. That keeps the
+# number of queries the same no matter how many lines the cart has.
+
+
+class CartLine:
+    def __init__(self, product, product_size, quantity):
+        self.product = product
+        self.product_size = product_size
+        self.quantity = quantity
+
+    @property
+    def size(self):
+        return self.product_size.size
+
+    @property
+    def price(self):
+        # Get product price from the backend since the user can change the price in the frontend.
+        if self.product.discount_price:
+            return self.product.discount_price * self.quantity
+        return self.product.regular_price * self.quantity
+
+
+class Cart:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def requested_quantities(self):
+        # The same size can show up on more than one line, so availability is checked against the sum.
+        requested = defaultdict(int)
+        for line in self.lines:
+            requested[line.product_size.id] += line.quantity
+        return requested
+
+    def unavailable_message(self):
+        requested = self.requested_quantities()
+        for line in self.lines:
+            quantity = requested[line.product_size.id]
+            available = line.product_size.available_quantity
+            if quantity > available:
+                return f'{quantity} items of size "{line.size}" of product "{line.product.name}" is not available. Only {available} items are available. Please try again.'
+        return None
+
+
+def load_cart(order_items_array):
+    items = []
+    for item in order_items_array:
+        quantity = item["quantity"]
+        size = item["size"][0]["size"]
+        if not quantity or not size:
+            continue
+        items.append((int(item["productData"]["id"]), size, int(quantity)))
+
+    product_ids = {product_id for product_id, _, _ in items}
+    products = Product.objects.in_bulk(product_ids)
+
+    size_filter = Q()
+    for product_id, size, _ in items:
+        size_filter |= Q(product_id=product_id, size=size)
+    product_sizes = {}
+    if items:
+        for product_size in ProductSize.objects.filter(size_filter):
+            product_sizes.setdefault((product_size.product_id, product_size.size), product_size)
+
+    lines = []
+    for product_id, size, quantity in items:
+        product = products.get(product_id)
+        product_size = product_sizes.get((product_id, size))
+        if product is None or product_size is None:
+            raise Http404("No Product matches the given query.")
+        product_size.product = product
+        lines.append(CartLine(product, product_size, quantity))
+
+    return Cart(lines)
+
+
+def create_order_items(order, cart, user=None, reduce_quantity=False):
+    with transaction.atomic():
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order,
+                    product=line.product,
+                    quantity=line.quantity,
+                    size=line.size,
+                    price=line.price,
+                )
+                for line in cart.lines
+            ]
+        )
+
+        if user is not None:
+            # One eligible reviewer instance per product, even if the product is on more than one line. By id, the
+            # user may only be the token's claims (api/authentication.py).
+            products = {line.product.id: line.product for line in cart.lines}
+            EligibleReviewer.objects.bulk_create(
+                [
+                    EligibleReviewer(user_id=user.id, product=product, order=order)
+                    for product in products.values()
+                ]
+            )
+
+        if reduce_quantity:
+            reduce_cart_quantity(cart)
+
+
+def reduce_cart_quantity(cart):
+    reduce_stock(
+        [StockLine(line.product.id, line.size, line.quantity) for line in cart.lines]
+    )
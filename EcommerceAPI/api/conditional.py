@@ -0,0 +1,100 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+# Conditional GET. A response is tagged with the version stamps of what it shows ("product:<id>", "categories",
+# "reviews:<product id>", "orders:<username>"), each a random token and the time it was set, kept in Django's cache
+# and replaced by touch() when a signal sees a change. The ETag is made from the tokens and Last-Modified is the
+# newest time, so a request with a matching If-None-Match (or an If-Modified-Since that isn't older) gets a 304
+# without the rows being loaded or serialized. Product stamps are touched with the product's cache version
+# (cache.invalidate_products), which covers its images, sizes and ratings too. With the local memory cache a worker
+# doesn't see the stamps another one touched, its own expire after CACHE_VERSION_TIMEOUT so a 304 for changed data
+# is at most that late.
+
+STAMP_KEY = "stamp:{}"
+
+
+def get_key(scope):
+    # Scopes can hold usernames, which aren't safe cache keys.
+    return STAMP_KEY.format(hashlib.md5(scope.encode()).hexdigest())
+
+
+def get_timeout():
+    # None (kept until replaced) with a shared cache, see CACHE_VERSION_TIMEOUT in settings.
+    return getattr(settings, "CACHE_VERSION_TIMEOUT", None)
+
+
+def new_stamp():
+    return (uuid.uuid4().hex, time.time())
+
+
+def get_stamps(scopes):
+    keys = [get_key(scope) for scope in scopes]
+    stamps = cache.get_many(keys)
+    # A scope without a stamp (never changed, or evicted) gets a new one, so an old ETag can't match again.
+    missing = [key for key in keys if key not in stamps]
+    if missing:
+        for key in missing:
+            cache.add(key, new_stamp(), timeout=get_timeout())
+        stamps.update(cache.get_many(missing))
+    return [stamps[key] for key in keys]
+
+
+def touch(*scopes):
+    # After the commit, otherwise a concurrent read could send the old rows with the new ETag.
+    transaction.on_commit(
+        lambda: cache.set_many({get_key(scope): new_stamp() for scope in scopes}, timeout=get_timeout())
+    )
+
+
+def etag_matches(if_none_match, etag):
+    # Weak comparison: compressed responses carry the ETag as W/"..." (see api/middleware.py).
+    etags = [tag[2:] if tag.startswith("W/") else tag for tag in parse_etags(if_none_match)]
+    return etag in etags or "*" in etags
+
+
+def is_not_modified(request, etag, modified):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    # HTTP dates are whole seconds, a change made in the same second as the client's copy is only seen by the ETag.
+    if_modified_since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return if_modified_since is not None and int(modified) <= if_modified_since
+
+
+def respond(request, scopes, build):
+    # build() makes the full response, and is only called when the client's copy is out of date. The stamps are
+    # read first: a change made while the response is built gives it an ETag that is already out of date.
+    stamps = get_stamps(scopes)
+    etag = quote_etag(
+        hashlib.md5(
+            ",".join([request.get_full_path()] + [token for token, _ in stamps]).encode()
+        ).hexdigest()
+    )
+    modified = max(stamped for _, stamped in stamps)
+
+    if is_not_modified(request, etag, modified):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(int(modified))
+    return response
+
+
+class ConditionalListMixin:
+    # For list views: the scopes come from get_version_scopes().
+    def list(self, request, *args, **kwargs):
+        return respond(
+            request,
+            self.get_version_scopes(),
+            lambda: super(ConditionalListMixin, self).list(request, *args, **kwargs),
+        )
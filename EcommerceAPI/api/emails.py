@@ -0,0 +1,56 @@
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .tasks import enqueue, task
+
+# Emails are never sent from a request. send_email only queues them, the task below hands them to the transport set
+# in settings.EMAIL_TRANSPORT. StubTransport keeps them in memory, for development and tests without network access.
+
+
+class MailgunTransport:
+    # This is for production. Won't work in development since i'll have to provide a valid domain.
+    url = "https://api.mailgun.net/v3/sandboxf6d030c564634e419adf8fff551213a2.mailgun.org/messages"
+    auth = ("api", "1c07200319baf33aa4844ddd98a67e8f-6b161b0a-74422a83")
+    sender = "Mailgun Sandbox <postmaster@sandboxf6d030c564634e419adf8fff551213a2.mailgun.org>"
+
+    def send(self, to, subject, text):
+        response = requests.post(
+            self.url,
+            auth=self.auth,
+            data={
+                "from": self.sender,
+                "to": to,
+                "subject": subject,
+                "text": text,
+            },
+            timeout=10,
+        )
+        # Let the task fail so it gets retried.
+        response.raise_for_status()
+
+
+class StubTransport:
+    outbox = []
+
+    def send(self, to, subject, text):
+        self.outbox.append({"to": to, "subject": subject, "text": text})
+
+
+def get_transport():
+    return import_string(settings.EMAIL_TRANSPORT)()
+
+
+def send_email(first_name, last_name, to, subject, text):
+    if to:
+        enqueue(
+            "deliver_email",
+            to=f"{first_name} {last_name} <{to}>",
+            subject=subject,
+            text=text,
+        )
+
+
+@task
+def deliver_email(to, subject, text):
+    get_transport().send(to, subject, text)
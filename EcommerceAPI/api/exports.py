@@ -0,0 +1,116 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.db import reset_queries
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order, OrderItem
+
+# Order export for admins (export_orders view and command), one line per order item in CSV and one line per order,
+# with its items, in JSONL. Orders are read with iterator() and their items prefetched a chunk of orders at a time,
+# and every line is written out as soon as it's built, so memory doesn't depend on how many orders are exported.
+
+ORDER_FIELDS = [
+    "id",
+    "date_ordered",
+    "status",
+    "user_id",
+    "username",
+    "first_name",
+    "last_name",
+    "email",
+    "phone",
+    "address",
+    "payment_method",
+    "transaction_id",
+    "online_paid",
+    "shipping_charge",
+    "outside_comilla",
+    "total",
+]
+
+ITEM_FIELDS = ["product_id", "product_name", "size", "quantity", "price"]
+
+CSV_FIELDS = [f"order_{field}" if field == "id" else field for field in ORDER_FIELDS] + ITEM_FIELDS
+
+
+def parse_day(value):
+    # YYYY-MM-DD, ValueError for anything else.
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f"Invalid date: {value}")
+    return day
+
+
+def get_orders(date_from=None, date_to=None, status=None):
+    # date_from and date_to are dates, both included.
+    orders = Order.objects.order_by("id")
+    if date_from:
+        orders = orders.filter(
+            date_ordered__gte=timezone.make_aware(datetime.combine(date_from, time.min))
+        )
+    if date_to:
+        orders = orders.filter(
+            date_ordered__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+        )
+    if status:
+        orders = orders.filter(status=status)
+    return orders
+
+
+def export_orders(orders, chunk_size=2000):
+    items = OrderItem.objects.select_related("product").only(
+        "order_id", "product_id", "product__name", "size", "quantity", "price"
+    ).order_by("id")
+    orders = orders.prefetch_related(Prefetch("orderitem_set", queryset=items)).iterator(
+        chunk_size=chunk_size
+    )
+    for number, order in enumerate(orders, 1):
+        if number % chunk_size == 0:
+            # With DEBUG on, the query log would keep every chunk's queries.
+            reset_queries()
+        row = {field: getattr(order, field) for field in ORDER_FIELDS}
+        row["date_ordered"] = order.date_ordered.isoformat()
+        row["items"] = [
+            {
+                "product_id": item.product_id,
+                "product_name": item.product.name,
+                "size": item.size,
+                "quantity": item.quantity,
+                "price": item.price,
+            }
+            for item in order.orderitem_set.all()
+        ]
+        yield row
+
+
+class Echo:
+    # csv.writer writes into this and gets the line back, so it can be yielded.
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.DictWriter(Echo(), fieldnames=CSV_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        order = {f"order_{field}" if field == "id" else field: row[field] for field in ORDER_FIELDS}
+        # Orders without items still get a line.
+        for item in row["items"] or [{}]:
+            yield writer.writerow({**order, **item})
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+FORMATS = {
+    "csv": (iter_csv, "text/csv"),
+    "jsonl": (iter_jsonl, "application/x-ndjson"),
+}
@@ -0,0 +1,125 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .cache import invalidate_products
+from .models import Product, ProductImage
+from .tasks import enqueue, task
+
+# Uploaded images are stored under the sha256 of their content (img/<hash>.<ext>), so uploading the same picture
+# again, for the same or another product, reuses the stored file. The resized variants below are made by the task
+# workers (manage.py run_tasks, run as many as needed), never in the request. Until they are ready the variants of an
+# image are empty and clients keep using the original.
+
+VARIANTS = {
+    "thumb": 160,
+    "card": 480,
+    "zoom": 1600,
+}
+
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif"}
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def store_image(file):
+    try:
+        image = Image.open(file)
+        image.verify()
+    except Exception:
+        raise InvalidImage(f"{file.name} is not a valid image.")
+
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    extension = EXTENSIONS.get(image.format, os.path.splitext(file.name)[1].lower())
+    name = f"img/{digest.hexdigest()}{extension}"
+
+    if not default_storage.exists(name):
+        file.seek(0)
+        name = default_storage.save(name, file)
+    return name
+
+
+def get_variant_name(name, variant, extension):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f"img/variants/{stem}/{variant}.{extension}"
+
+
+def build_variants(name):
+    # Variants that already exist are kept, so building the same image twice only costs the checks.
+    with default_storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+
+    # JPEG has no transparency, transparent images are put on a white background.
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    variants = {}
+    for variant, size in VARIANTS.items():
+        resized = image.copy()
+        # Only ever shrinks, small originals keep their size.
+        resized.thumbnail((size, size), Image.LANCZOS)
+        for extension, (image_format, options) in FORMATS.items():
+            variant_name = get_variant_name(name, variant, extension)
+            if not default_storage.exists(variant_name):
+                buffer = BytesIO()
+                resized.save(buffer, image_format, **options)
+                variant_name = default_storage.save(
+                    variant_name, ContentFile(buffer.getvalue())
+                )
+            variants.setdefault(variant, {})[extension] = variant_name
+    return variants
+
+
+def get_known_variants(names):
+    # Variants already built for these files, by any product.
+    known = {}
+    rows = ProductImage.objects.filter(image__in=names).exclude(variants={})
+    for name, variants in rows.values_list("image", "variants"):
+        known[name] = variants
+    return known
+
+
+def queue_variants(names):
+    for name in names:
+        enqueue("build_image_variants", path=name)
+
+
+@task
+def build_image_variants(path):
+    variants = build_variants(path)
+
+    # The file may be shared by several images and products, they all get the variants.
+    with transaction.atomic():
+        ProductImage.objects.filter(image=path).update(variants=variants)
+        product_ids = list(
+            Product.objects.filter(intro_image=path).values_list("id", flat=True)
+        )
+        Product.objects.filter(id__in=product_ids).update(
+            intro_image_variants=variants
+        )
+        product_ids += ProductImage.objects.filter(image=path).values_list(
+            "product_id", flat=True
+        )
+        invalidate_products(set(product_ids))
+
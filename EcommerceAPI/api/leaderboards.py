@@ -0,0 +1,122 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Product
+
+# The home page lists (best sellers and new arrivals, for the whole store and per category) are kept ready in the
+# cache as short lists of [product id, score], so reading them needs no query and no sort. They are kept up to date
+# as products sell (reduce_stock) and are created. Both scores only ever go up (sold) or are the newest (id), so a
+# product can only enter a list by beating its last entry, and the list never needs more rows than it shows.
+#
+# Anything else that can move a product between lists (an edit, a deletion, a renamed category) drops all the lists,
+# they are rebuilt from the database on the next read with one indexed query each. Updates are made from absolute
+# values, so if two processes update the same list at once the next sale of the lost product puts it right, and the
+# lists expire after LEADERBOARD_TIMEOUT in any case. With the local memory cache a worker doesn't see another's
+# updates or drops, its generation expires after CACHE_VERSION_TIMEOUT and its lists are loaded again.
+
+BOARDS = {
+    "top": "sold",
+    "new": "id",
+}
+
+GENERATION_KEY = "leaderboard-generation"
+
+lock = threading.Lock()
+
+
+def get_size():
+    return getattr(settings, "LEADERBOARD_SIZE", 12)
+
+
+def get_generation_timeout():
+    # None (kept until replaced) with a shared cache, see CACHE_VERSION_TIMEOUT in settings.
+    return getattr(settings, "CACHE_VERSION_TIMEOUT", None)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, timeout=get_generation_timeout())
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def get_key(board, category_slug, generation):
+    return f"leaderboard:{generation}:{board}:{category_slug or ''}"
+
+
+def load(board, category_slug=None):
+    score = BOARDS[board]
+    qs = Product.objects.all()
+    if category_slug:
+        qs = qs.filter(category__slug=category_slug)
+    return [
+        list(row)
+        for row in qs.order_by(f"-{score}", "-id").values_list("id", score)[: get_size()]
+    ]
+
+
+def get_product_ids(board, category_slug=None):
+    key = get_key(board, category_slug, get_generation())
+    entries = cache.get(key)
+    if entries is None:
+        entries = load(board, category_slug)
+        cache.set(key, entries, timeout=getattr(settings, "LEADERBOARD_TIMEOUT", 3600))
+    return [product_id for product_id, _ in entries]
+
+
+def update(board, category_slug, product_id, score, generation):
+    # Lists that aren't cached are left alone, they will be loaded with this product in them.
+    key = get_key(board, category_slug, generation)
+    with lock:
+        entries = cache.get(key)
+        if entries is None:
+            return
+
+        entries = [entry for entry in entries if entry[0] != product_id]
+        entries.append([product_id, score])
+        entries.sort(key=lambda entry: (entry[1], entry[0]), reverse=True)
+        cache.set(
+            key, entries[: get_size()], timeout=getattr(settings, "LEADERBOARD_TIMEOUT", 3600)
+        )
+
+
+def update_products(board, rows):
+    generation = get_generation()
+    for product_id, category_slug, score in rows:
+        update(board, None, product_id, score, generation)
+        update(board, category_slug, product_id, score, generation)
+
+
+def record_sales(product_ids):
+    # Read the new sold counts once the sale is committed.
+    product_ids = list(product_ids)
+    if product_ids:
+        transaction.on_commit(
+            lambda: update_products(
+                "top",
+                Product.objects.filter(id__in=product_ids).values_list(
+                    "id", "category__slug", "sold"
+                ),
+            )
+        )
+
+
+def record_new_product(product):
+    category_slug = product.category.slug
+
+    def update_boards():
+        update_products("new", [(product.id, category_slug, product.id)])
+        update_products("top", [(product.id, category_slug, product.sold)])
+
+    transaction.on_commit(update_boards)
+
+
+def invalidate():
+    transaction.on_commit(
+        lambda: cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=get_generation_timeout())
+    )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.images import build_image_variants, queue_variants
+from api.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = "Queue (or, with --now, build) the resized variants of the images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--now", action="store_true", help="Build them here instead of in the task workers.")
+
+    def handle(self, *args, **options):
+        names = set(ProductImage.objects.filter(variants={}).values_list("image", flat=True))
+        names |= set(
+            Product.objects.filter(intro_image_variants={})
+            .exclude(intro_image__isnull=True)
+            .exclude(intro_image="")
+            .values_list("intro_image", flat=True)
+        )
+
+        if options["now"]:
+            for name in sorted(names):
+                build_image_variants(name)
+        else:
+            queue_variants(sorted(names))
+        self.stdout.write(self.style.SUCCESS(f"{len(names)} images."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import queryplans
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the benchmark scenarios and fail if any of their queries reads a whole table (sqlite). "
+        "Run seed_benchmark_data first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", nargs="*", help="Names of the scenarios to check.")
+
+    def handle(self, *args, **options):
+        try:
+            failures = queryplans.check(only=options["only"], log=self.stdout.write)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if failures:
+            raise CommandError(f"{failures} queries read a whole table or scenarios could not be checked.")
+        self.stdout.write(self.style.SUCCESS("No full table scans."))
@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from api.catalog import export_catalog
+
+
+class Command(BaseCommand):
+    help = "Write every product with its category and sizes to a CSV or JSONL catalog file (stdout with -)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-")
+        parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("jsonl" if path.endswith(".jsonl") else "csv")
+        if path == "-":
+            export_catalog(sys.stdout, file_format, chunk_size=options["chunk_size"])
+            return
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            count = export_catalog(file, file_format, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} products."))
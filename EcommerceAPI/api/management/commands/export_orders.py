@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import exports
+
+
+class Command(BaseCommand):
+    help = "Write orders and their items to a CSV or JSONL file (stdout with -), optionally by date range and status."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-")
+        parser.add_argument("--format", choices=list(exports.FORMATS), default=None)
+        parser.add_argument("--from", dest="date_from", help="YYYY-MM-DD, included.")
+        parser.add_argument("--to", dest="date_to", help="YYYY-MM-DD, included.")
+        parser.add_argument("--status")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("jsonl" if path.endswith(".jsonl") else "csv")
+        try:
+            orders = exports.get_orders(
+                exports.parse_day(options["date_from"]),
+                exports.parse_day(options["date_to"]),
+                options["status"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        write, _ = exports.FORMATS[file_format]
+        lines = write(exports.export_orders(orders, chunk_size=options["chunk_size"]))
+        if path == "-":
+            sys.stdout.writelines(lines)
+            return
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            file.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(f"Exported orders to {path}."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog import CatalogError, import_catalog
+
+
+class Command(BaseCommand):
+    help = "Create or update products, categories and sizes from a CSV or JSONL catalog file (see api/catalog.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("jsonl" if path.endswith(".jsonl") else "csv")
+        try:
+            with open(path, newline="", encoding="utf-8") as file:
+                total, created, updated = import_catalog(
+                    file, file_format, chunk_size=options["chunk_size"], log=self.stdout.write
+                )
+        except CatalogError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {total} products ({created} new, {updated} updated, {total - created - updated} unchanged)."
+            )
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.tokens import prune_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding and blacklisted refresh tokens in batches. Meant to run daily (cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        count = prune_tokens(batch_size=options["batch_size"], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} expired tokens."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.sales import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily product and category sales totals from the orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = rebuild_sales(chunk_size=options["chunk_size"], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Went through {count} orders."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from the product table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.moderation import repair_unanswered_count
+
+
+class Command(BaseCommand):
+    help = "Recount the unanswered questions shown by the moderator queue."
+
+    def handle(self, *args, **options):
+        count = repair_unanswered_count()
+        self.stdout.write(self.style.SUCCESS(f"{count} unanswered questions."))
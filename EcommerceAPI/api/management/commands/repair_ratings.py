@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.ratings import repair_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute the rating totals and star histogram of every product from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = repair_ratings(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Fixed {count} products."))
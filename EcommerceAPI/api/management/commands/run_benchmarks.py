@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a request against every api route and report p50/p95/p99 latency, query count and peak memory. "
+        "Run seed_benchmark_data first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--only", nargs="*", help="Names of the scenarios to run.")
+        parser.add_argument("--output", help="Write the results to this json file.")
+        parser.add_argument("--compare", help="A json file from an earlier run to compare against.")
+
+    def handle(self, *args, **options):
+        try:
+            results = benchmarks.run(
+                iterations=options["iterations"], only=options["only"], log=self.stdout.write
+            )
+        except benchmarks.ScenarioError as e:
+            raise CommandError(str(e))
+        if options["output"]:
+            benchmarks.save(results, options["output"])
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+        if options["compare"]:
+            benchmarks.compare(benchmarks.load(options["compare"]), results, log=self.stdout.write)
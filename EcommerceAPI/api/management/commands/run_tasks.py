@@ -0,0 +1,44 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.tasks import run_due_tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks (emails, image variants). Keeps running until stopped unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run the due tasks once and exit.")
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--sleep", type=float, default=5, help="Seconds to wait when there is nothing to do.")
+        parser.add_argument("--workers", type=int, default=1, help="Worker threads in this process.")
+
+    def handle(self, *args, **options):
+        if options["workers"] <= 1:
+            self.work(options)
+            return
+
+        threads = [
+            threading.Thread(target=self.work, args=(options,), daemon=True)
+            for _ in range(options["workers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def work(self, options):
+        try:
+            while True:
+                count = run_due_tasks(batch_size=options["batch_size"])
+                if count:
+                    self.stdout.write(f"Ran {count} tasks.")
+                if options["once"]:
+                    break
+                if not count:
+                    time.sleep(options["sleep"])
+        finally:
+            connection.close()
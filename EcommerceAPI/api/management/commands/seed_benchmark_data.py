@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Fill the database with generated users, products, orders, reviews and questions for run_benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--products", type=int, default=10000)
+        parser.add_argument("--orders", type=int, default=5000)
+        parser.add_argument("--items-per-order", type=int, default=3)
+        parser.add_argument("--reviews", type=int, default=5000)
+        parser.add_argument("--questions", type=int, default=5000)
+        parser.add_argument("--tokens", type=int, default=0, help="Outstanding refresh tokens, most of them blacklisted.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        benchmarks.seed(
+            users=options["users"],
+            categories=options["categories"],
+            products=options["products"],
+            orders=options["orders"],
+            items_per_order=options["items_per_order"],
+            reviews=options["reviews"],
+            questions=options["questions"],
+            tokens=options["tokens"],
+            chunk_size=options["chunk_size"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS("Seeded."))
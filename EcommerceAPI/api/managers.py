@@ -1,4 +1,9 @@
+import re
+
 from django.contrib.auth.models import BaseUserManager
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, IntegerField, Max, Q, Value, When
+from django.db.models.functions import Cast, Substr
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -14,3 +19,39 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
         return self.create_user(email, password, **extra_fields)
+
+    def get_free_username(self, base):
+        # base if it's free, otherwise base.<n> with n one above the highest suffix in use. One query reading the
+        # username index between "base." and "base/" ("/" sorts right after "."), however many users share the name.
+        prefix = f'{base}.'
+        taken = self.filter(
+            Q(username=base)
+            | Q(
+                username__gt=prefix,
+                username__lt=f'{base}/',
+                username__regex=rf'^{re.escape(prefix)}[0-9]+$',
+            )
+        ).aggregate(
+            base=Count('id', filter=Q(username=base)),
+            last=Max(
+                Case(
+                    When(username=base, then=Value(0)),
+                    default=Cast(Substr('username', len(prefix) + 1), IntegerField()),
+                )
+            ),
+        )
+        if not taken['base']:
+            return base
+        return f'{prefix}{taken["last"] + 1}'
+
+    def create_user_with_free_username(self, base, email, password=None, attempts=5, **extra_fields):
+        # Two signups with the same name can pick the same username, the unique constraint stops the second one,
+        # which then tries the next one.
+        for attempt in range(attempts):
+            username = self.get_free_username(base)
+            try:
+                with transaction.atomic():
+                    return self.create_user(email, password, username=username, **extra_fields)
+            except IntegrityError:
+                if attempt == attempts - 1 or not self.filter(username=username).exists():
+                    raise
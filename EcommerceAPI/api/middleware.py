@@ -0,0 +1,193 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Counts the SQL queries each request runs, how long they take and how many repeat a query already run in the same
+# request (the usual sign of an N+1). Views can declare how many queries they are allowed: @query_budget(n) on a
+# function view (above @api_view) or a query_budget attribute on a class based view. Going over the budget logs a
+# warning, or raises QueryBudgetExceeded when settings.QUERY_BUDGET_STRICT is on (tests). With
+# settings.QUERY_BUDGET_SERVER_TIMING the numbers are also sent in a Server-Timing header for the browser's devtools.
+# Authentication (the claims version lookup on a cold cache, see api/authentication.py) runs inside uncounted(): the
+# budgets are the view's own queries, whether the request came with a token or not.
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(budget):
+    def decorator(view):
+        view.query_budget = budget
+        return view
+
+    return decorator
+
+
+def get_query_budget(view_func):
+    budget = getattr(view_func, "query_budget", None)
+    if budget is None:
+        budget = getattr(getattr(view_func, "view_class", None), "query_budget", None)
+    return budget
+
+
+def get_view_name(view_func):
+    view_class = getattr(view_func, "view_class", None)
+    view = view_class or view_func
+    return f"{view.__module__}.{view.__name__}"
+
+
+class QueryCollector:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.duplicates = 0
+        self.seen = set()
+        self.uncounted = 0
+        self.paused = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.paused:
+            self.uncounted += 1
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            if sql in self.seen:
+                self.duplicates += 1
+            else:
+                self.seen.add(sql)
+
+
+@contextmanager
+def uncounted(request):
+    # Queries run inside don't count against the view's budget.
+    collector = getattr(request, "query_collector", None)
+    if collector is None or collector.paused:
+        yield
+        return
+    collector.paused = True
+    try:
+        yield
+    finally:
+        collector.paused = False
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget_view = None
+        request.query_collector = collector = QueryCollector()
+        with connection.execute_wrapper(collector):
+            response = self.get_response(request)
+
+        view_func = request.query_budget_view
+        view_name = get_view_name(view_func) if view_func is not None else request.path
+        logger.debug(
+            "%s: %s queries (%s duplicated) in %.1fms, %s more for authentication",
+            view_name,
+            collector.count,
+            collector.duplicates,
+            collector.duration * 1000,
+            collector.uncounted,
+        )
+
+        if getattr(settings, "QUERY_BUDGET_SERVER_TIMING", False):
+            response["Server-Timing"] = (
+                f'db;dur={collector.duration * 1000:.1f};desc="{collector.count} queries, '
+                f'{collector.duplicates} duplicated"'
+            )
+
+        budget = get_query_budget(view_func) if view_func is not None else None
+        if budget is not None and collector.count > budget:
+            message = (
+                f"{view_name} ran {collector.count} queries ({collector.duplicates} duplicated), "
+                f"its budget is {budget}."
+            )
+            if getattr(settings, "QUERY_BUDGET_STRICT", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget_view = view_func
+
+
+# Response compression. Bodies of at least COMPRESSION_MIN_SIZE bytes are sent with brotli when the client accepts it
+# and the brotli package is installed, gzip otherwise (GZipMiddleware, which also pads its output against BREACH).
+# Streamed responses (the exports) are compressed as they go.
+
+
+def get_accepted_encodings(request):
+    # Codings the client lists without q=0.
+    encodings = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def compress_brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if (
+            brotli is None
+            or response.has_header("Content-Encoding")
+            or "br" not in get_accepted_encodings(request)
+            or (response.streaming and response.is_async)
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if response.streaming:
+            response.streaming_content = compress_brotli_sequence(response.streaming_content)
+            del response.headers["Content-Length"]
+        else:
+            compressed_content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers["Content-Length"] = str(len(response.content))
+
+        # Like GZipMiddleware: the compressed body isn't the same bytes, so a strong ETag becomes weak.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from api import search
+
+    search.create_index(schema_editor)
+
+    # Index the products that already exist.
+    Product = apps.get_model("api", "Product")
+    search.index_products(Product.objects.select_related("category"))
+
+
+def drop_search_index(apps, schema_editor):
+    from api import search
+
+    search.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='intro_image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
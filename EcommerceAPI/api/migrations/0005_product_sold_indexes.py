@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-sold', '-id'], name='product_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-sold', '-id'], name='product_category_sold_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-18 18:37
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_histogram(apps, schema_editor):
+    Product = apps.get_model("api", "Product")
+    Review = apps.get_model("api", "Review")
+    histograms = {}
+    for product_id, rating, count in (
+        Review.objects.values_list("product_id", "rating").annotate(count=Count("id")).order_by()
+    ):
+        histograms.setdefault(product_id, {})[f"ratings_{rating}"] = count
+    for product_id, counts in histograms.items():
+        Product.objects.filter(id=product_id).update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_product_sold_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='ratings_1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratings_5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_product_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='claims_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 19:55
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicates(apps, schema_editor):
+    # The old toggle could add a product twice, keep the first row.
+    WishList = apps.get_model("api", "WishList")
+    duplicates = (
+        WishList.objects.values("user_id", "product_id")
+        .annotate(count=Count("id"), first_id=Min("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        WishList.objects.filter(user_id=row["user_id"], product_id=row["product_id"]).exclude(
+            id=row["first_id"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_user_claims_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_wishlist_item'),
+        ),
+    ]
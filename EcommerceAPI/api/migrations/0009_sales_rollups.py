@@ -0,0 +1,63 @@
+# Generated by Django 4.2 on 2026-10-18 20:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from api import sales
+
+
+def backfill_sales(apps, schema_editor):
+    # Count the orders placed before the tables existed, like the rebuild_sales command.
+    sales.rebuild_sales(log=lambda message: None, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_unique_wishlist_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='counted_in_sales',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.FloatField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.category')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productsales',
+            index=models.Index(fields=['product', 'day'], name='product_sales_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productsales',
+            constraint=models.UniqueConstraint(fields=('day', 'product'), name='unique_product_sales_day'),
+        ),
+        migrations.AddIndex(
+            model_name='categorysales',
+            index=models.Index(fields=['category', 'day'], name='category_sales_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='categorysales',
+            constraint=models.UniqueConstraint(fields=('day', 'category'), name='unique_category_sales_day'),
+        ),
+        migrations.RunPython(backfill_sales, migrations.RunPython.noop),
+    ]
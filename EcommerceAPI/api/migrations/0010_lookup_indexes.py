@@ -0,0 +1,62 @@
+# Generated by Django 4.2 on 2026-10-18 20:30
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_sizes(apps, schema_editor):
+    # add_product_sizes accepted the same size twice, keep the first row with the quantities added up.
+    ProductSize = apps.get_model("api", "ProductSize")
+    duplicates = (
+        ProductSize.objects.values("product_id", "size")
+        .annotate(count=Count("id"), first_id=Min("id"), quantity=Sum("available_quantity"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        sizes = ProductSize.objects.filter(product_id=row["product_id"], size=row["size"])
+        sizes.filter(id=row["first_id"]).update(available_quantity=row["quantity"])
+        sizes.exclude(id=row["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_sizes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='eligiblereviewer',
+            index=models.Index(fields=['user', 'product'], name='eligible_reviewer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['username', '-id'], name='order_username_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['transaction_id'], name='order_transaction_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-id'], name='order_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qna',
+            index=models.Index(condition=models.Q(('answer__isnull', True), ('answer', ''), _connector='OR'), fields=['id'], name='qna_unanswered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['image'], name='productimage_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_moderator', True)), fields=['id'], name='user_moderator_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productsize',
+            constraint=models.UniqueConstraint(fields=('product', 'size'), name='unique_product_size'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 20:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Q
+
+
+def count_unanswered(apps, schema_editor):
+    QnA = apps.get_model("api", "QnA")
+    Counter = apps.get_model("api", "Counter")
+    Counter.objects.update_or_create(
+        name="qna-unanswered",
+        defaults={"value": QnA.objects.filter(Q(answer__isnull=True) | Q(answer="")).count()},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='qna',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='qna',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(count_unanswered, migrations.RunPython.noop),
+    ]
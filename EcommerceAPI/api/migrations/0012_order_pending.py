@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+def set_pending(apps, schema_editor):
+    Order = apps.get_model("api", "Order")
+    Order.objects.exclude(status="Pending").update(pending=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_qna_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='pending',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(set_pending, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-pending', '-id'], name='order_pending_idx'),
+        ),
+    ]
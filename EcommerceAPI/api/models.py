@@ -1,5 +1,6 @@
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 
 # Create your models here.
@@ -19,6 +20,16 @@ class User(AbstractUser):
     address = models.CharField(max_length=300, blank=True, null=True)
     is_moderator = models.BooleanField(default=False)
     is_admin = models.BooleanField(default=False)
+    # Goes up on every save, tokens issued before that stop being trusted on their own (see api/authentication.py).
+    claims_version = models.PositiveIntegerField(default=0)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # The moderators list (get_moderators).
+            models.Index(
+                fields=["id"], condition=models.Q(is_moderator=True), name="user_moderator_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -47,10 +58,27 @@ class Product(models.Model):
     intro_image = models.ImageField(
         upload_to="img", default=None, null=True, blank=True
     )
+    # Resized copies of intro_image, see api/images.py.
+    intro_image_variants = models.JSONField(default=dict, blank=True)
     sold = models.IntegerField(default=0)
     total_ratings = models.FloatField(default=0)
     total_reviews = models.IntegerField(default=0)
     avg_rating = models.FloatField(default=0)
+    # Number of reviews giving each rating, see api/ratings.py.
+    ratings_1 = models.IntegerField(default=0)
+    ratings_2 = models.IntegerField(default=0)
+    ratings_3 = models.IntegerField(default=0)
+    ratings_4 = models.IntegerField(default=0)
+    ratings_5 = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Rebuilding the best seller lists, see api/leaderboards.py.
+            models.Index(fields=["-sold", "-id"], name="product_sold_idx"),
+            models.Index(
+                fields=["category", "-sold", "-id"], name="product_category_sold_idx"
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
@@ -63,6 +91,14 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     image = models.ImageField(upload_to="img")
+    # {"thumb": {"webp": <name>, "jpeg": <name>}, "card": ..., "zoom": ...}, empty until the variants are built.
+    variants = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            # Stored images are shared by content hash, looked up by name (see api/images.py).
+            models.Index(fields=["image"], name="productimage_image_idx"),
+        ]
 
     def __str__(self):
         return self.product.name
@@ -76,6 +112,11 @@ class ProductSize(models.Model):
     size = models.CharField(max_length=10)
     available_quantity = models.IntegerField()  # of this size.
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "size"], name="unique_product_size"),
+        ]
+
     def __str__(self):
         return self.product.name
 
@@ -110,6 +151,29 @@ class Order(models.Model):
     transaction_id = models.CharField(max_length=256, blank=True, null=True)
     # only for online payments.
     online_paid = models.BooleanField(default=False)
+    # Whether the order's items are in the daily sales totals, see api/sales.py.
+    counted_in_sales = models.BooleanField(default=False)
+    # status == "Pending", kept by save() so OrderList can list pending orders first from an index.
+    pending = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            # A customer's orders, newest first (get_user_orders).
+            models.Index(fields=["username", "-id"], name="order_username_idx"),
+            # The payment callbacks.
+            models.Index(fields=["transaction_id"], name="order_transaction_idx"),
+            # Orders with a given status, newest first (order export).
+            models.Index(fields=["status", "-id"], name="order_status_idx"),
+            # Pending orders first, then the rest, newest first (OrderList).
+            models.Index(fields=["-pending", "-id"], name="order_pending_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.pending = self.status == "Pending"
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "pending"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         if self.first_name:
@@ -129,11 +193,50 @@ class OrderItem(models.Model):
     price = models.FloatField()
 
 
+# Daily sales totals, kept up to date as orders are confirmed and their status changes (see api/sales.py), so sales
+# reports don't have to go through every order item.
+
+
+class ProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    units = models.IntegerField(default=0)
+    revenue = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "product"], name="unique_product_sales_day"),
+        ]
+        indexes = [
+            models.Index(fields=["product", "day"], name="product_sales_day_idx"),
+        ]
+
+
+class CategorySales(models.Model):
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    units = models.IntegerField(default=0)
+    revenue = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "category"], name="unique_category_sales_day"),
+        ]
+        indexes = [
+            models.Index(fields=["category", "day"], name="category_sales_day_idx"),
+        ]
+
+
 class WishList(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="unique_wishlist_item"),
+        ]
+
     def __str__(self):
         return f"{self.user} added {self.product} on {self.added_on}"
 
@@ -144,11 +247,38 @@ class QnA(models.Model):
     question = models.TextField()
     answer = models.TextField(blank=True, null=True)
     date = models.DateTimeField(auto_now_add=True)
+    # The moderator answering the question, until claimed_until (see api/moderation.py).
+    claimed_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True, related_name="+"
+    )
+    claimed_until = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Only the unanswered questions, oldest first (UnansweredList).
+            models.Index(
+                fields=["id"],
+                condition=models.Q(answer__isnull=True) | models.Q(answer=""),
+                name="qna_unanswered_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.question}"
 
 
+# Running totals kept up to date as rows change, so they can be read without counting the rows (see
+# api/moderation.py).
+
+
+class Counter(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
 # Reviews. For now only registered users can review.
 # I'll have a new model for this, with user and product, that way
 # I will check if the user really purchased the product or not, I wont have to check a whole lot of things to know if the
@@ -161,6 +291,12 @@ class EligibleReviewer(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Not unique, every order of the product makes the user eligible.
+            models.Index(fields=["user", "product"], name="eligible_reviewer_idx"),
+        ]
+
     def __str__(self):
         return f'{self.user} is elligible to review "{self.product.name}"'
 
@@ -178,4 +314,27 @@ class Review(models.Model):
         return f"{self.user} reviewed {self.product} on {self.date}"
 
 
+# Background tasks (emails for now). Views only add a row here, the run_tasks command picks them up and runs them,
+# retrying failed ones with a growing delay. A task that keeps failing ends up "dead" and stays here for inspection.
+
+
+class Task(models.Model):
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, default="pending")  # pending, running, done or dead
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
 # TODO: Try to fix the date format in the backend, like travelMedia.
\ No newline at end of file
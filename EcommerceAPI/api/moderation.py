@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .emails import send_email
+from .models import Counter, QnA
+
+# Moderator queue for unanswered questions. A moderator claims a batch of the oldest unanswered questions nobody else
+# holds, and keeps them for QNA_LEASE seconds; a lease that runs out (the moderator left) makes them claimable again.
+# Claims and answers are conditional UPDATEs, like the task queue's (api/tasks.py), so two moderators never get the
+# same question and an answer never lands on a question someone else holds. Reading the unanswered questions goes
+# through the partial index on them (qna_unanswered_idx).
+#
+# The number of unanswered questions is kept in a Counter row: new questions add to it (signals.py), answering and
+# deleting them take from it. repair_unanswered_count (repair_qna_queue command) recounts it.
+
+UNANSWERED_COUNTER = "qna-unanswered"
+
+UNANSWERED = Q(answer__isnull=True) | Q(answer="")
+
+
+def claimable(now):
+    return UNANSWERED & (Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+
+
+def not_held_by_others(user, now):
+    return Q(claimed_by_id=user.id) | Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+
+
+def get_lease():
+    return timedelta(seconds=settings.QNA_LEASE)
+
+
+def add_to_counter(name, amount):
+    if amount and not Counter.objects.filter(name=name).update(value=F("value") + amount):
+        Counter.objects.get_or_create(name=name)
+        Counter.objects.filter(name=name).update(value=F("value") + amount)
+
+
+def get_counter(name):
+    return Counter.objects.filter(name=name).values_list("value", flat=True).first() or 0
+
+
+def get_unanswered_count():
+    return get_counter(UNANSWERED_COUNTER)
+
+
+def claim(user, size=None):
+    # Returns the questions claimed and when the lease ends. Questions taken by someone else between the SELECT and
+    # the UPDATE are skipped, so a claim can come back smaller than asked.
+    size = max(1, min(size or settings.QNA_CLAIM_SIZE, settings.QNA_MAX_CLAIM_SIZE))
+    now = timezone.now()
+    until = now + get_lease()
+    ids = list(QnA.objects.filter(claimable(now)).order_by("id").values_list("id", flat=True)[:size])
+    QnA.objects.filter(claimable(now), id__in=ids).update(claimed_by_id=user.id, claimed_until=until)
+    questions = QnA.objects.filter(id__in=ids, claimed_by_id=user.id, claimed_until=until).order_by("id")
+    return questions, until
+
+
+def release(user, ids=None):
+    questions = QnA.objects.filter(claimed_by_id=user.id, claimed_until__isnull=False)
+    if ids is not None:
+        questions = questions.filter(id__in=ids)
+    return questions.update(claimed_by=None, claimed_until=None)
+
+
+def notify(qna, answer):
+    send_email(
+        qna.user.first_name,
+        qna.user.last_name,
+        qna.user.email,
+        "Your question was answered",
+        f'Your question about "{qna.product.name}" was answered.\n\nQ: {qna.question}\nA: {answer}',
+    )
+
+
+def answer(qna, user, text):
+    # Returns False when another moderator holds the question. Editing an answered question is fine, only answering
+    # an unanswered one changes the count and tells the asker.
+    now = timezone.now()
+    allowed = QnA.objects.filter(not_held_by_others(user, now), id=qna.id)
+    with transaction.atomic():
+        answered = allowed.filter(UNANSWERED).update(answer=text, claimed_by=None, claimed_until=None)
+        if answered:
+            add_to_counter(UNANSWERED_COUNTER, -1)
+        elif not allowed.update(answer=text, claimed_by=None, claimed_until=None):
+            return False
+    if answered:
+        notify(qna, text)
+    return True
+
+
+def answer_claimed(user, answers):
+    # answers maps question ids to their answer. Only the unanswered questions this moderator still holds are
+    # answered; returns their ids.
+    now = timezone.now()
+    held = QnA.objects.filter(UNANSWERED, claimed_by_id=user.id, claimed_until__gte=now)
+    answered = []
+    with transaction.atomic():
+        for qna_id, text in answers.items():
+            if held.filter(id=qna_id).update(answer=text, claimed_by=None, claimed_until=None):
+                answered.append(qna_id)
+        add_to_counter(UNANSWERED_COUNTER, -len(answered))
+
+    for qna in QnA.objects.filter(id__in=answered).select_related("user", "product"):
+        notify(qna, answers[qna.id])
+    return answered
+
+
+def repair_unanswered_count():
+    count = QnA.objects.filter(UNANSWERED).count()
+    Counter.objects.update_or_create(name=UNANSWERED_COUNTER, defaults={"value": count})
+    return count
@@ -0,0 +1,131 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Page numbers stay the default. A client that sends ?cursor= (empty for the first page) gets keyset pages instead:
+# the next page starts right after the last row of this one (WHERE (a, id) > (last_a, last_id)) instead of using
+# OFFSET, so deep pages cost the same as the first one, and COUNT(*) only runs when asked for with ?count=true.
+# The keys are the view's own ordering, which has to be made of field or annotation names ending with the id.
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_keyset_ordering(queryset)
+        self.use_cursor = (
+            self.cursor_query_param in request.query_params and self.ordering is not None
+        )
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == "true":
+            self.count = queryset.count()
+
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request.query_params[self.cursor_query_param])
+        if cursor is not None:
+            cursor = self.clean_cursor(queryset, cursor)
+        if cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(cursor))
+
+        rows = list(queryset[: page_size + 1])
+        page = rows[:page_size]
+        self.next_cursor = None
+        if len(rows) > page_size:
+            self.next_cursor = self.encode_cursor(self.get_key_values(page[-1]))
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+
+        response = {"next": self.get_next_cursor_link(), "results": data}
+        if self.count is not None:
+            response = {"count": self.count, **response}
+        return Response(response)
+
+    def get_keyset_ordering(self, queryset):
+        # Sliced querysets and plain lists can't be filtered, they keep page numbers.
+        if not isinstance(queryset, QuerySet) or queryset.query.is_sliced:
+            return None
+
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not ordering or not all(isinstance(field, str) for field in ordering):
+            return None
+        if ordering[-1].lstrip("-") not in ("id", "pk"):
+            return None
+        return ordering
+
+    def get_key_values(self, row):
+        names = [field.lstrip("-") for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        if len(names) == 1 and not hasattr(row, names[0]):
+            # values_list(flat=True) rows are the value itself.
+            return [row]
+        return [getattr(row, name) for name in names]
+
+    def get_keyset_filter(self, values):
+        keyset = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition = Q(**{f"{name}__{lookup}": values[i]})
+            for previous, value in zip(self.ordering[:i], values[:i]):
+                condition &= Q(**{previous.lstrip("-"): value})
+            keyset |= condition
+        return keyset
+
+    def encode_cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor.")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound("Invalid cursor.")
+        return values
+
+    def get_key_field(self, queryset, name):
+        # None for keys that span relations (category__name), their values are only checked for their type.
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        if name == "pk":
+            return queryset.model._meta.pk
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def clean_cursor(self, queryset, values):
+        # The values come from the client, each has to be a valid value of its key.
+        cleaned = []
+        for field, value in zip(self.ordering, values):
+            if value is None or isinstance(value, (dict, list)):
+                raise NotFound("Invalid cursor.")
+            key_field = self.get_key_field(queryset, field.lstrip("-"))
+            try:
+                cleaned.append(key_field.to_python(value) if key_field is not None else value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound("Invalid cursor.")
+        return cleaned
+
+    def get_next_cursor_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
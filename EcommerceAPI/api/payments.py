@@ -0,0 +1,218 @@
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from sslcommerz_lib import SSLCOMMERZ
+
+# All calls to the payment gateway go through one shared client per process (get_gateway()). It keeps keep-alive
+# connections in a pool, bounds every call with connect/read timeouts and stops calling the gateway for a while when
+# it keeps failing (circuit breaker), so checkouts fail fast instead of piling up behind a dead gateway.
+# settings.PAYMENT_GATEWAY picks the implementation; FakeGateway answers locally, for development and load tests.
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayUnavailable(GatewayError):
+    pass
+
+
+class CircuitBreaker:
+    # closed: calls go through. open: calls are refused until reset_timeout has passed. half-open: one trial call
+    # goes through, its result closes or re-opens the circuit.
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class GatewayMetrics:
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        # Latencies of the last `window` calls, in seconds.
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, latency, error):
+        with self.lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+            self.latencies.append(latency)
+
+    def record_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            snapshot = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rejected": self.rejected,
+            }
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+
+        snapshot["p50_ms"] = percentile(0.5)
+        snapshot["p95_ms"] = percentile(0.95)
+        snapshot["p99_ms"] = percentile(0.99)
+        return snapshot
+
+
+class Gateway:
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            settings.PAYMENT_BREAKER_THRESHOLD, settings.PAYMENT_BREAKER_RESET
+        )
+        self.metrics = GatewayMetrics()
+
+    def call(self, func, *args):
+        if not self.breaker.allow():
+            self.metrics.record_rejected()
+            raise GatewayUnavailable("The payment gateway is not responding.")
+
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.metrics.record(time.perf_counter() - start, error=True)
+            self.breaker.record_failure()
+            raise GatewayError(str(e)) from e
+
+        self.metrics.record(time.perf_counter() - start, error=False)
+        self.breaker.record_success()
+        return result
+
+    def create_session(self, post_body):
+        return self.call(self.request_session, post_body)
+
+    def validate(self, val_id):
+        return self.call(self.request_validation, val_id)
+
+    def get_metrics(self):
+        metrics = self.metrics.snapshot()
+        metrics["circuit"] = self.breaker.state
+        return metrics
+
+
+class PooledSSLCOMMERZ(SSLCOMMERZ):
+    # Same api as sslcommerz_lib, but over a shared session with timeouts, and errors are raised instead of printed.
+    def __init__(self, config, session, timeout):
+        super().__init__(config)
+        self.session = session
+        self.timeout = timeout
+
+    def call_api(self, method, url, payload):
+        if method == "POST":
+            response = self.session.post(url, data=payload, timeout=self.timeout)
+        else:
+            response = self.session.get(url, params=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class SSLCommerzGateway(Gateway):
+    def __init__(self):
+        super().__init__()
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.PAYMENT_GATEWAY_POOL_SIZE
+        )
+        session.mount("https://", adapter)
+        self.client = PooledSSLCOMMERZ(
+            {
+                "store_id": settings.STORE_ID,
+                "store_pass": settings.STORE_PASSWD,
+                "issandbox": settings.PAYMENT_GATEWAY_SANDBOX,
+            },
+            session,
+            settings.PAYMENT_GATEWAY_TIMEOUT,
+        )
+
+    def request_session(self, post_body):
+        return self.client.createSession(post_body)
+
+    def request_validation(self, val_id):
+        return self.client.validationTransactionOrder(val_id)
+
+
+class FakeGateway(Gateway):
+    # Accepts every session and validates every payment, after FAKE_GATEWAY_LATENCY seconds. A share of the calls
+    # (FAKE_GATEWAY_FAILURE_RATE) fails, to see the breaker at work.
+    def wait(self):
+        time.sleep(getattr(settings, "FAKE_GATEWAY_LATENCY", 0))
+        if random.random() < getattr(settings, "FAKE_GATEWAY_FAILURE_RATE", 0):
+            raise requests.ConnectionError("Fake gateway failure.")
+
+    def request_session(self, post_body):
+        self.wait()
+        return {
+            "status": "SUCCESS",
+            "sessionkey": uuid.uuid4().hex,
+            "GatewayPageURL": f"{post_body['success_url']}?tran_id={post_body['tran_id']}",
+        }
+
+    def request_validation(self, val_id):
+        self.wait()
+        return {"status": "VALID", "val_id": val_id}
+
+
+gateway = None
+gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global gateway
+    if gateway is None:
+        with gateway_lock:
+            if gateway is None:
+                gateway = import_string(settings.PAYMENT_GATEWAY)()
+    return gateway
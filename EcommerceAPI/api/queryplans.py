@@ -0,0 +1,94 @@
+import re
+
+from django.db import connection
+
+from . import benchmarks
+
+# Query plan check (check_query_plans command). Replays the benchmark scenarios, asks sqlite for the plan of every
+# SELECT, UPDATE and DELETE they ran (EXPLAIN QUERY PLAN, with the same parameters) and reports the ones that read a
+# whole table. Reading a table in order is fine when the query stops early (LIMIT, nothing sorted after the scan), like
+# the newest products. Run it on a seeded database (seed_benchmark_data): on a near empty one sqlite is happy to scan.
+
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+# Tables that are read whole on purpose.
+ALLOWED_TABLES = {
+    # A handful of rows, listed whole by get_categories.
+    "api_category",
+}
+# Scenarios that don't touch the database, any other scenario without queries failed to check anything.
+QUERYLESS_SCENARIOS = {
+    # The gateway's counters are kept in memory.
+    "payment_metrics",
+}
+
+
+class QueryCollector:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(EXPLAINED):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def get_plan(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def get_full_scans(sql, plan):
+    stops_early = " LIMIT " in sql.upper() and not any("TEMP B-TREE" in step for step in plan)
+    scans = []
+    for step in plan:
+        match = FULL_SCAN.match(step)
+        if match and match.group(1) not in ALLOWED_TABLES and not stops_early:
+            scans.append(match.group(1))
+    return scans
+
+
+def check(only=None, log=print):
+    # Returns the number of queries that read a whole table, plus the scenarios that failed or ran no queries.
+    if connection.vendor != "sqlite":
+        raise ValueError("The query plan check reads sqlite's EXPLAIN QUERY PLAN output.")
+
+    ctx = benchmarks.get_context()
+    failures = 0
+    with benchmarks.isolated():
+        for name, method, path, role, data in benchmarks.get_scenarios(only):
+            client = benchmarks.get_client(ctx, role)
+            collector = QueryCollector()
+            with connection.execute_wrapper(collector):
+                response, _ = benchmarks.request(client, method, "/api/" + path.format(**ctx), data, ctx)
+
+            # Nothing was checked if the request failed or ran no queries.
+            if not 200 <= response.status_code < 400:
+                failures += 1
+                log(f"{name:<24} FAILED with status {response.status_code}")
+                continue
+            if not collector.queries and name not in QUERYLESS_SCENARIOS:
+                failures += 1
+                log(f"{name:<24} FAILED, no queries to check")
+                continue
+
+            problems = []
+            for sql, params in collector.queries:
+                plan = get_plan(sql, params)
+                scans = get_full_scans(sql, plan)
+                if scans:
+                    problems.append((sql, plan, scans))
+
+            if not problems:
+                log(f"{name:<24} ok ({len(collector.queries)} queries)")
+            else:
+                failures += len(problems)
+                log(f"{name:<24} FULL SCAN")
+                for sql, plan, scans in problems:
+                    log(f"    {', '.join(scans)}: {sql}")
+                    for step in plan:
+                        log(f"        {step}")
+    return failures
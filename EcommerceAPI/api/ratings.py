@@ -0,0 +1,67 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField
+
+from .cache import invalidate_products
+from .models import Product, Review
+
+# A product's rating totals and its 1-5 star histogram are changed by a single UPDATE with F() expressions, so
+# reviews posted at the same time can't overwrite each other and no other column of the product is written.
+# repair_ratings recomputes them all from the reviews.
+
+HISTOGRAM_FIELDS = {star: f"ratings_{star}" for star in range(1, 6)}
+
+RATING_FIELDS = ["total_ratings", "total_reviews", "avg_rating", *HISTOGRAM_FIELDS.values()]
+
+
+def add_rating(product_id, rating):
+    # Every expression in the SET clause reads the row as it was before the update.
+    field = HISTOGRAM_FIELDS[rating]
+    Product.objects.filter(id=product_id).update(
+        total_ratings=F("total_ratings") + rating,
+        total_reviews=F("total_reviews") + 1,
+        avg_rating=ExpressionWrapper(
+            (F("total_ratings") + rating) / (F("total_reviews") + 1),
+            output_field=FloatField(),
+        ),
+        **{field: F(field) + 1},
+    )
+    invalidate_products([product_id])
+
+
+def get_rating_values(histogram):
+    total_reviews = sum(histogram.values())
+    total_ratings = sum(star * count for star, count in histogram.items())
+    values = {
+        "total_ratings": total_ratings,
+        "total_reviews": total_reviews,
+        "avg_rating": total_ratings / total_reviews if total_reviews else 0,
+    }
+    for star, field in HISTOGRAM_FIELDS.items():
+        values[field] = histogram[star]
+    return values
+
+
+def repair_ratings(chunk_size=2000):
+    # Recomputes every product from its reviews with one grouped query and writes only the products that were
+    # wrong. Returns how many were fixed. Reviews posted while it runs may be missed, run it again to pick them up.
+    histograms = defaultdict(lambda: dict.fromkeys(HISTOGRAM_FIELDS, 0))
+    for product_id, rating, count in (
+        Review.objects.values_list("product_id", "rating").annotate(count=Count("id")).order_by()
+    ):
+        histograms[product_id][rating] = count
+
+    empty = dict.fromkeys(HISTOGRAM_FIELDS, 0)
+    changed = []
+    for product in Product.objects.only("id", *RATING_FIELDS).iterator(chunk_size=chunk_size):
+        values = get_rating_values(histograms.get(product.id, empty))
+        if any(getattr(product, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(product, field, value)
+            changed.append(product)
+
+    with transaction.atomic():
+        Product.objects.bulk_update(changed, RATING_FIELDS, batch_size=chunk_size)
+        invalidate_products([product.id for product in changed])
+    return len(changed)
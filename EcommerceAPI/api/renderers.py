@@ -0,0 +1,37 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON rendered with orjson, several times faster than the json module on the product lists. The output is the same
+# JSON as JSONRenderer's but not always the same bytes: compact, utf-8, dates and decimals as DRF writes them (orjson
+# hands them to DRF's encoder) and U+2028/U+2029 escaped, but some floats are written differently (1e16 instead of
+# 1e+16). Data orjson can't encode (integers wider than 64 bits) goes to JSONRenderer. orjson is optional: without
+# it, or when a client asks for indented json, this is JSONRenderer.
+
+# orjson writes these two as they are, DRF escapes them for javascript.
+LINE_SEPARATORS = (("\u2028".encode(), b"\\u2028"), ("\u2029".encode(), b"\\u2029"))
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                # Integer keys (get_availability) become strings like json.dumps does.
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
@@ -0,0 +1,206 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Case, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CategorySales, Order, OrderItem, ProductSales
+
+# Daily units and revenue per product and per category (ProductSales, CategorySales). An order is counted once it's
+# confirmed (cash on delivery, or paid online) and as long as it isn't cancelled. Order.counted_in_sales says whether
+# it currently is: whenever an order is saved, record_order compares that with what it should be and adds or removes
+# the order's items, claiming the change with a conditional UPDATE so it's applied once. Revenue is the sum of the
+# item prices (shipping not included), on the day the order was placed. A product that moves to another category
+# keeps its past sales in the old one; rebuild_sales (rebuild_sales command) recomputes everything from the orders.
+
+CANCELLED_STATUSES = ["Cancelled", "Canceled"]
+
+COUNTED = (Q(payment_method="COD") | Q(online_paid=True)) & ~Q(status__in=CANCELLED_STATUSES)
+
+
+def is_counted(order):
+    return (order.payment_method == "COD" or order.online_paid) and (
+        order.status not in CANCELLED_STATUSES
+    )
+
+
+def get_order_totals(order_id, day):
+    products = defaultdict(lambda: [0, 0])
+    categories = defaultdict(lambda: [0, 0])
+    for product_id, category_id, quantity, price in OrderItem.objects.filter(
+        order_id=order_id
+    ).values_list("product_id", "product__category_id", "quantity", "price"):
+        for totals in (products[(day, product_id)], categories[(day, category_id)]):
+            totals[0] += quantity
+            totals[1] += price
+    return products, categories
+
+
+def by_key(key_field, values, output_field):
+    # CASE <key> WHEN <key> THEN <value> ... END, for one UPDATE over a day's rows.
+    return Case(
+        *[When(**{key_field: key}, then=Value(value)) for key, value in values.items()],
+        output_field=output_field,
+    )
+
+
+def add_totals(model, key_field, totals, sign):
+    # Make sure the rows exist, then add to them with one UPDATE per day (an order has one day).
+    model.objects.bulk_create(
+        [model(day=day, **{key_field: key}) for day, key in totals], ignore_conflicts=True
+    )
+    days = defaultdict(dict)
+    for (day, key), day_totals in totals.items():
+        days[day][key] = day_totals
+    for day, rows in days.items():
+        model.objects.filter(day=day, **{f"{key_field}__in": rows}).update(
+            units=F("units")
+            + by_key(key_field, {key: sign * units for key, (units, _) in rows.items()}, IntegerField()),
+            revenue=F("revenue")
+            + by_key(key_field, {key: sign * revenue for key, (_, revenue) in rows.items()}, FloatField()),
+        )
+
+
+def apply_order(order_id, day, sign):
+    products, categories = get_order_totals(order_id, day)
+    add_totals(ProductSales, "product_id", products, sign)
+    add_totals(CategorySales, "category_id", categories, sign)
+
+
+def record_order(order_id):
+    with transaction.atomic():
+        order = Order.objects.filter(id=order_id).first()
+        if order is None:
+            return
+        counted = is_counted(order)
+        if counted == order.counted_in_sales:
+            return
+        if Order.objects.filter(id=order_id, counted_in_sales=not counted).update(
+            counted_in_sales=counted
+        ):
+            apply_order(order_id, timezone.localdate(order.date_ordered), 1 if counted else -1)
+
+
+def remove_order(order):
+    # Before the order and its items are deleted.
+    if order.counted_in_sales:
+        apply_order(order.id, timezone.localdate(order.date_ordered), -1)
+
+
+def merge_totals(model, key_field, rows):
+    # rows are (day, key, units, revenue) for one chunk of orders. Orders are read in id order, which is also date
+    # order, so a chunk only shares its first and last days with the others.
+    rows = {(row["day"], row["key"]): row for row in rows}
+    if not rows:
+        return
+    existing = {
+        (row.day, getattr(row, key_field)): row
+        for row in model.objects.filter(
+            day__in={day for day, _ in rows}, **{f"{key_field}__in": {key for _, key in rows}}
+        )
+    }
+    updated = []
+    for key, row in rows.items():
+        if key in existing:
+            existing[key].units += row["units"]
+            existing[key].revenue += row["revenue"]
+            updated.append(existing[key])
+    model.objects.bulk_update(updated, ["units", "revenue"], batch_size=500)
+    model.objects.bulk_create(
+        [
+            model(day=day, units=row["units"], revenue=row["revenue"], **{key_field: key})
+            for (day, key), row in rows.items()
+            if (day, key) not in existing
+        ]
+    )
+
+
+def rebuild_sales(chunk_size=2000, log=print, apps=None):
+    # Starts over and adds the orders a chunk at a time. Meant to be run when orders aren't coming in (or right
+    # after the tables were created): an order confirmed during the rebuild could be counted twice. Migrations pass
+    # their apps, to run it on the historical models.
+    apps = apps or global_apps
+    Order = apps.get_model("api", "Order")
+    OrderItem = apps.get_model("api", "OrderItem")
+    ProductSales = apps.get_model("api", "ProductSales")
+    CategorySales = apps.get_model("api", "CategorySales")
+
+    ProductSales.objects.all().delete()
+    CategorySales.objects.all().delete()
+    Order.objects.filter(counted_in_sales=True).update(counted_in_sales=False)
+
+    last_id = 0
+    count = 0
+    while True:
+        ids = list(
+            Order.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            orders = Order.objects.filter(id__gte=ids[0], id__lte=ids[-1])
+            items = (
+                OrderItem.objects.filter(order__in=orders.filter(COUNTED))
+                .annotate(day=TruncDate("order__date_ordered"))
+                .order_by()
+            )
+            merge_totals(
+                ProductSales,
+                "product_id",
+                items.values("day", key=F("product_id")).annotate(
+                    units=Sum("quantity"), revenue=Sum("price")
+                ),
+            )
+            merge_totals(
+                CategorySales,
+                "category_id",
+                items.values("day", key=F("product__category_id")).annotate(
+                    units=Sum("quantity"), revenue=Sum("price")
+                ),
+            )
+            orders.filter(COUNTED).update(counted_in_sales=True)
+        last_id = ids[-1]
+        count += len(ids)
+        log(f"{count} orders")
+    return count
+
+
+def get_report(date_from, date_to, group_by, category=None, product_id=None, limit=50):
+    # Totals between two days (both included) per day, product or category, read from the daily tables only. One
+    # product's sales are only in ProductSales, they are grouped by the product's current category.
+    if group_by == "product" or product_id:
+        rows = ProductSales.objects.filter(day__gte=date_from, day__lte=date_to)
+        if product_id:
+            rows = rows.filter(product_id=product_id)
+        if category:
+            rows = rows.filter(product__category__slug=category)
+    else:
+        rows = CategorySales.objects.filter(day__gte=date_from, day__lte=date_to)
+        if category:
+            rows = rows.filter(category__slug=category)
+
+    if group_by == "day":
+        rows = rows.values("day").order_by("day")
+    elif group_by == "product":
+        rows = rows.values("product_id", name=F("product__name"), slug=F("product__slug"))
+    elif rows.model is ProductSales:
+        rows = rows.values(
+            category_id=F("product__category_id"),
+            name=F("product__category__name"),
+            slug=F("product__category__slug"),
+        )
+    else:
+        rows = rows.values("category_id", name=F("category__name"), slug=F("category__slug"))
+    rows = rows.annotate(units=Sum("units"), revenue=Sum("revenue"))
+    if group_by != "day":
+        rows = rows.order_by("-revenue")[:limit]
+    return list(rows)
+
+
+def get_default_range():
+    # The last 30 days.
+    today = timezone.localdate()
+    return today - timedelta(days=29), today
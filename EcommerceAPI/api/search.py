@@ -0,0 +1,192 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Product
+
+# Product search runs against a full-text index kept next to the product table, one row per product, so a search
+# never has to scan the catalog with LIKE '%q%'.
+#   - sqlite: an FTS5 virtual table (api_product_fts) whose rowid is the product id, ranked with bm25().
+#   - postgres: a tsvector table (api_product_search) with a GIN index, ranked with ts_rank_cd().
+# Other databases fall back to the old icontains search. Rows are kept in sync by the signals in signals.py.
+
+FTS_TABLE = "api_product_fts"
+TSVECTOR_TABLE = "api_product_search"
+
+# Column weights: a hit in the name counts more than a hit in the category, which counts more than the description.
+NAME_WEIGHT = 10.0
+CATEGORY_WEIGHT = 5.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Only the best matches are ranked and paged through; nobody pages past the first few hundred results of a search
+# box. A short prefix or a category name can match most of the catalog though, and scoring every match is what
+# makes a search slow, so only the newest CANDIDATE_WINDOW matches are scored.
+MAX_RESULTS = 600
+CANDIDATE_WINDOW = 10000
+
+
+def create_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, category, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        # Make ORDER BY rank use the weighted bm25 score.
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) "
+            f"VALUES ('rank', 'bm25({NAME_WEIGHT}, {CATEGORY_WEIGHT}, {DESCRIPTION_WEIGHT})')"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TSVECTOR_TABLE} ("
+            "product_id bigint PRIMARY KEY REFERENCES api_product (id) ON DELETE CASCADE "
+            "DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TSVECTOR_TABLE}_document_idx "
+            f"ON {TSVECTOR_TABLE} USING GIN (document)"
+        )
+
+
+def drop_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == "postgresql":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TSVECTOR_TABLE}")
+
+
+def is_supported():
+    return connection.vendor in ("sqlite", "postgresql")
+
+
+def index_products(products, replace=True):
+    # products must come with their category loaded (select_related("category")). Pass replace=False when the
+    # products are known not to be in the index yet.
+    if not is_supported():
+        return
+
+    rows = [
+        (product.id, product.name, product.category.name, product.description)
+        for product in products
+    ]
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            if replace:
+                cursor.executemany(
+                    f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                    [(row[0],) for row in rows],
+                )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, category, description) VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {TSVECTOR_TABLE} (product_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C')) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+
+def unindex_products(product_ids):
+    if not is_supported() or not product_ids:
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                [(product_id,) for product_id in product_ids],
+            )
+        else:
+            cursor.executemany(
+                f"DELETE FROM {TSVECTOR_TABLE} WHERE product_id = %s",
+                [(product_id,) for product_id in product_ids],
+            )
+
+
+def rebuild_index(chunk_size=2000):
+    if not is_supported():
+        return 0
+
+    count = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            else:
+                cursor.execute(f"DELETE FROM {TSVECTOR_TABLE}")
+
+        chunk = []
+        for product in (
+            Product.objects.select_related("category")
+            .order_by("id")
+            .iterator(chunk_size)
+        ):
+            chunk.append(product)
+            if len(chunk) >= chunk_size:
+                index_products(chunk, replace=False)
+                count += len(chunk)
+                chunk = []
+        index_products(chunk, replace=False)
+        count += len(chunk)
+
+    return count
+
+
+def get_terms(query):
+    return re.findall(r"\w+", query)
+
+
+def get_ranked_ids(terms, limit):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            match = " ".join(f'"{term}"*' for term in terms)
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"AND rowid >= coalesce((SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                "ORDER BY rowid DESC LIMIT 1 OFFSET %s), 0) "
+                "ORDER BY rank LIMIT %s",
+                [match, match, CANDIDATE_WINDOW - 1, limit],
+            )
+        else:
+            tsquery = " & ".join(f"{term}:*" for term in terms)
+            cursor.execute(
+                f"SELECT product_id FROM {TSVECTOR_TABLE}, to_tsquery('simple', %s) query "
+                "WHERE document @@ query "
+                f"AND product_id >= coalesce((SELECT product_id FROM {TSVECTOR_TABLE} "
+                "WHERE document @@ to_tsquery('simple', %s) ORDER BY product_id DESC LIMIT 1 OFFSET %s), 0) "
+                "ORDER BY ts_rank_cd(document, query) DESC, product_id DESC LIMIT %s",
+                [tsquery, tsquery, CANDIDATE_WINDOW - 1, limit],
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_product_ids(query, limit=MAX_RESULTS):
+    # Returns the ids of the matching products, best match first. Every word of the query has to match, and the
+    # last letters typed don't have to be a whole word ("shi" finds "shirt").
+    if not is_supported():
+        return list(
+            Product.objects.filter(
+                Q(name__icontains=query)
+                | Q(description__icontains=query)
+                | Q(category__name__icontains=query)
+            )
+            .order_by("-id")
+            .values_list("id", flat=True)[:limit]
+        )
+
+    terms = get_terms(query)
+    if not terms:
+        return []
+
+    return get_ranked_ids(terms, limit)
@@ -1,31 +1,74 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import Category, Product, ProductImage, ProductSize, User, Order, OrderItem, WishList, QnA, Review
 
 
+class EagerLoadingMixin:
+    # Relations the serializer reads from each instance. Views load them together with the queryset (see
+    # EagerLoadingMixin in views.py), otherwise every nested serializer costs a query per row.
+    select_related = []
+    prefetch_related = []
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        if cls.prefetch_related:
+            queryset = queryset.prefetch_related(*cls.prefetch_related)
+        return queryset
+
+
+def get_variant_urls(variants, request=None):
+    urls = {}
+    for variant, files in variants.items():
+        urls[variant] = {}
+        for extension, name in files.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant][extension] = url
+    return urls
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     category = CategorySerializer(required=False)
+    intro_image_variants = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
+    select_related = ['category']
 
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'regular_price',
-                  'discount_price', 'stock', 'slug', 'intro_image', 'total_ratings',
-                  'total_reviews', 'avg_rating', 'category']
+                  'discount_price', 'stock', 'slug', 'intro_image', 'intro_image_variants',
+                  'total_ratings', 'total_reviews', 'avg_rating', 'rating_histogram', 'category']
+
+    def get_intro_image_variants(self, obj):
+        return get_variant_urls(obj.intro_image_variants, self.context.get('request'))
+
+    def get_rating_histogram(self, obj):
+        return {star: getattr(obj, f'ratings_{star}') for star in range(1, 6)}
 
 
 class ImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'product', 'image']
+        fields = ['id', 'product', 'image', 'variants']
+
+    def get_variants(self, obj):
+        return get_variant_urls(obj.variants, self.context.get('request'))
 
 
-class ProductSizeSerializer(serializers.ModelSerializer):
+class ProductSizeSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     product = ProductSerializer()
+    select_related = ['product__category']
 
     class Meta:
         model = ProductSize
@@ -72,37 +115,41 @@ class OrderSerializer(serializers.ModelSerializer):
                   'outside_comilla', 'payment_method', 'total', 'transaction_id', 'online_paid']
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     order = OrderSerializer()
     product = ProductSerializer()
+    select_related = ['order', 'product__category']
 
     class Meta:
         model = OrderItem
         fields = ['id', 'order', 'product', 'quantity', 'size', 'price']
 
 
-class WishListSerializer(serializers.ModelSerializer):
+class WishListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = UserDataSerializer1()
     product = ProductSerializer()
+    select_related = ['user', 'product__category']
 
     class Meta:
         model = WishList
         fields = ['id', 'user', 'product', 'date']
 
 
-class QnASerializer(serializers.ModelSerializer):
+class QnASerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = UserDataSerializer1()
     answer = serializers.CharField(max_length=1000, required=False)
     product = ProductSerializer(required=False)
+    select_related = ['user', 'product__category']
 
     class Meta:
         model = QnA
         fields = ['id', 'question', 'answer', 'date', 'product', 'user']
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = UserDataSerializer1(required=False)
     product = ProductSerializer(required=False)
+    select_related = ['user', 'product__category']
 
     class Meta:
         model = Review
@@ -0,0 +1,166 @@
+from django.db.models import F
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .models import Category, Order, Product, ProductImage, ProductSize, QnA, Review, User
+from . import authentication, cache, conditional, leaderboards, moderation, sales, search, tokens
+
+
+# Keep the product search index in sync.
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.unindex_products([instance.id])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    # A renamed category changes what its products match.
+    if not created and not raw:
+        search.index_products(
+            Product.objects.filter(category=instance).select_related("category")
+        )
+
+
+# Drop cached product fragments.
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    cache.invalidate_products([instance.id])
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_product_image(sender, instance, **kwargs):
+    cache.invalidate_products([instance.product_id])
+
+
+# The version also tags the product's stock (see get_availability).
+@receiver([post_save, post_delete], sender=ProductSize)
+def invalidate_product_size(sender, instance, **kwargs):
+    cache.invalidate_products([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category(sender, instance, created=False, **kwargs):
+    if not created:
+        cache.invalidate_category(instance.id)
+
+
+# Keep the home page leaderboards up to date. New products are added to them, any other change that could move a
+# product between them drops them all.
+
+
+@receiver(post_save, sender=Product)
+def update_leaderboards(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        leaderboards.record_new_product(instance)
+    else:
+        leaderboards.invalidate()
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_leaderboards(sender, instance, **kwargs):
+    leaderboards.invalidate()
+
+
+@receiver(post_save, sender=Category)
+def rename_leaderboards(sender, instance, created=False, **kwargs):
+    # The category lists are keyed by slug.
+    if not created:
+        leaderboards.invalidate()
+
+
+# Keep the daily sales totals up to date. After the commit, so a new order's items are there too.
+
+
+@receiver(post_save, sender=Order)
+def record_order_sales(sender, instance, raw=False, **kwargs):
+    if not raw:
+        order_id = instance.id
+        transaction.on_commit(lambda: sales.record_order(order_id))
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_sales(sender, instance, **kwargs):
+    sales.remove_order(instance)
+
+
+# Count the unanswered questions for the moderator queue. Answers go through api/moderation.py, which counts them.
+
+
+@receiver(post_save, sender=QnA)
+def count_question(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and not instance.answer:
+        moderation.add_to_counter(moderation.UNANSWERED_COUNTER, 1)
+
+
+@receiver(post_delete, sender=QnA)
+def uncount_question(sender, instance, **kwargs):
+    if not instance.answer:
+        moderation.add_to_counter(moderation.UNANSWERED_COUNTER, -1)
+
+
+# Conditional GET stamps (api/conditional.py). Product stamps change with the product cache versions above.
+
+
+@receiver([post_save, post_delete], sender=Category)
+def touch_categories(sender, instance, **kwargs):
+    conditional.touch("categories")
+
+
+@receiver([post_save, post_delete], sender=Review)
+def touch_reviews(sender, instance, **kwargs):
+    conditional.touch(f"reviews:{instance.product_id}")
+
+
+@receiver([post_save, post_delete], sender=Order)
+def touch_user_orders(sender, instance, **kwargs):
+    if instance.username:
+        conditional.touch(f"orders:{instance.username}")
+
+
+@receiver(post_save, sender=User)
+def touch_user_reviews(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Reviews show the reviewer's name.
+    if not created and not raw and not is_login_update(update_fields):
+        product_ids = Review.objects.filter(user_id=instance.id).values_list("product_id", flat=True)
+        if product_ids:
+            conditional.touch(*{f"reviews:{product_id}" for product_id in product_ids})
+
+
+# Tokens issued before a user is changed (roles, email, deactivation...) must not be trusted on their own anymore.
+
+
+def is_login_update(update_fields):
+    return update_fields is not None and set(update_fields) == {"last_login"}
+
+
+@receiver(post_save, sender=User)
+def bump_claims_version(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if not created and not raw and not is_login_update(update_fields):
+        # A separate UPDATE, then the new value is read back: the instance may be saved again or put in a token in the
+        # same request (check_password saves an upgraded hash in the middle of a login).
+        User.objects.filter(id=instance.id).update(claims_version=F("claims_version") + 1)
+        instance.refresh_from_db(fields=["claims_version"])
+        authentication.forget_claims_version(instance.id)
+
+
+# Keep this process's token blacklist filter up to date, and tell the other processes.
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def record_blacklisted_token(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        tokens.record_blacklisted(instance.token.jti)
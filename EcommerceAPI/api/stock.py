@@ -0,0 +1,112 @@
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Product, ProductSize
+from .cache import invalidate_products
+from . import leaderboards
+
+# Stock is never read, changed in python and saved back. Sizes are reduced with conditional UPDATEs
+# (available_quantity >= quantity), so two checkouts racing for the last items can't both win and nothing oversells.
+# A checkout (all_or_nothing) reduces all its sizes in one UPDATE, and is rolled back if fewer rows than asked were
+# updated, so it costs the same queries however large the cart is. Without all_or_nothing (paid online orders) each
+# size gets its own UPDATE, to know which lines could not be reserved.
+
+StockLine = namedtuple("StockLine", ["product_id", "size", "quantity"])
+
+
+class InsufficientStock(Exception):
+    def __init__(self, failed_lines):
+        super().__init__("Some of the ordered sizes are out of stock.")
+        self.failed_lines = failed_lines
+
+
+def by_id(quantities):
+    # CASE id WHEN <id> THEN <quantity> ... END, for one UPDATE over many rows.
+    return Case(
+        *[When(id=row_id, then=Value(quantity)) for row_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def get_short_lines(requested, size_ids):
+    # The lines whose size doesn't have the quantity asked for (anymore).
+    available = dict(
+        ProductSize.objects.filter(id__in=size_ids.values()).values_list("id", "available_quantity")
+    )
+    return [
+        StockLine(product_id, size, quantity)
+        for (product_id, size), quantity in requested.items()
+        if available.get(size_ids.get((product_id, size)), 0) < quantity
+    ]
+
+
+class ShortStock(Exception):
+    pass
+
+
+def reduce_sizes(requested, size_ids):
+    # All the sizes in one UPDATE. Raises ShortStock if any of them is missing or short, the caller rolls back.
+    quantities = {size_ids[key]: quantity for key, quantity in requested.items() if key in size_ids}
+    updated = ProductSize.objects.filter(
+        id__in=quantities, available_quantity__gte=by_id(quantities)
+    ).update(available_quantity=F("available_quantity") - by_id(quantities))
+    if updated < len(requested):
+        raise ShortStock()
+
+
+def reduce_stock(lines, all_or_nothing=True):
+    # Returns the lines that could not be reserved. With all_or_nothing, any failure rolls the whole batch back and
+    # raises InsufficientStock instead.
+    requested = defaultdict(int)
+    for line in lines:
+        requested[(line.product_id, line.size)] += line.quantity
+
+    if not requested:
+        return []
+
+    product_ids = {product_id for product_id, _ in requested}
+    size_ids = {}
+    for size_id, product_id, size in (
+        ProductSize.objects.filter(product_id__in=product_ids)
+        .order_by("id")
+        .values_list("id", "product_id", "size")
+    ):
+        size_ids.setdefault((product_id, size), size_id)
+
+    failed = []
+    sold = defaultdict(int)
+    try:
+        with transaction.atomic():
+            if all_or_nothing:
+                reduce_sizes(requested, size_ids)
+                for (product_id, _), quantity in requested.items():
+                    sold[product_id] += quantity
+            else:
+                # Update rows in id order so concurrent orders lock them in the same order.
+                for key in sorted(requested, key=lambda key: size_ids.get(key, 0)):
+                    product_id, size = key
+                    quantity = requested[key]
+                    updated = 0
+                    if key in size_ids:
+                        updated = ProductSize.objects.filter(
+                            id=size_ids[key], available_quantity__gte=quantity
+                        ).update(available_quantity=F("available_quantity") - quantity)
+
+                    if updated:
+                        sold[product_id] += quantity
+                    else:
+                        failed.append(StockLine(product_id, size, quantity))
+
+            if sold:
+                Product.objects.filter(id__in=sold).update(
+                    stock=F("stock") - by_id(sold), sold=F("sold") + by_id(sold)
+                )
+            invalidate_products(sold)
+            leaderboards.record_sales(sold)
+    except ShortStock:
+        # Read once the batch is rolled back.
+        raise InsufficientStock(get_short_lines(requested, size_ids))
+
+    return failed
@@ -0,0 +1,100 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+# A small database backed task queue. Functions registered with @task can be queued with enqueue(name, **payload);
+# the payload has to be JSON serializable. The run_tasks management command runs them.
+
+TASKS = {}
+
+
+def task(func):
+    TASKS[func.__name__] = func
+    return func
+
+
+def enqueue(name, **payload):
+    return Task.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=getattr(settings, "TASK_MAX_ATTEMPTS", 5),
+    )
+
+
+def get_retry_delay(attempts):
+    # 30s, 1m, 2m, 4m... capped at an hour.
+    delay = getattr(settings, "TASK_RETRY_DELAY", 30) * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, 3600))
+
+
+def claimable(now):
+    # A running task whose lease ran out belongs to a worker that died, so it can be picked up again.
+    return Q(status="pending", run_at__lte=now) | Q(
+        status="running", locked_until__lt=now
+    )
+
+
+def claim(task_id, now):
+    lease = timedelta(seconds=getattr(settings, "TASK_LEASE", 300))
+    claimed = (
+        Task.objects.filter(claimable(now), id=task_id).update(
+            status="running",
+            locked_until=now + lease,
+            attempts=F("attempts") + 1,
+        )
+        == 1
+    )
+    if claimed:
+        return Task.objects.get(id=task_id)
+    return None
+
+
+def run_task(task_row):
+    func = TASKS.get(task_row.name)
+    try:
+        if func is None:
+            raise LookupError(f'No task named "{task_row.name}" is registered.')
+        func(**task_row.payload)
+    except Exception:
+        task_row.last_error = traceback.format_exc()
+        task_row.locked_until = None
+        if func is None or task_row.attempts >= task_row.max_attempts:
+            task_row.status = "dead"
+            task_row.finished = timezone.now()
+        else:
+            task_row.status = "pending"
+            task_row.run_at = timezone.now() + get_retry_delay(task_row.attempts)
+        task_row.save(
+            update_fields=["status", "run_at", "locked_until", "last_error", "finished"]
+        )
+        return False
+
+    task_row.status = "done"
+    task_row.locked_until = None
+    task_row.finished = timezone.now()
+    task_row.save(update_fields=["status", "locked_until", "finished"])
+    return True
+
+
+def run_due_tasks(batch_size=20):
+    # Runs up to batch_size tasks that are due and returns how many were run. Each task is claimed with a
+    # conditional UPDATE, so several workers can run side by side without running a task twice.
+    now = timezone.now()
+    task_ids = list(
+        Task.objects.filter(claimable(now))
+        .order_by("run_at")
+        .values_list("id", flat=True)[:batch_size]
+    )
+
+    count = 0
+    for task_id in task_ids:
+        task_row = claim(task_id, now)
+        if task_row is not None:
+            run_task(task_row)
+            count += 1
+    return count
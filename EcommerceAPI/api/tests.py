@@ -0,0 +1,1210 @@
+import base64
+import csv
+import io
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import benchmarks, leaderboards, moderation, payments, queryplans, tokens
+from .cache import serialize_products
+from .catalog import CatalogError, import_catalog
+from .checkout import load_cart
+from .emails import StubTransport, send_email
+from .models import Category, Counter, EligibleReviewer, Order, OrderItem, Product, ProductSales, ProductSize, QnA, Review, Task, User, WishList
+from .renderers import ORJSONRenderer
+from .stock import StockLine, reduce_stock
+from .tasks import TASKS, claim, enqueue, run_due_tasks
+from .tokens import Blacklist, BloomFilter, RefreshToken, prune_tokens
+from .views import MyTokenObtainPairSerializer
+
+PASSWORD = "test-password-123"
+
+
+def create_product(name="Shirt", category=None, stock=10, price=100):
+    category = category or Category.objects.get_or_create(name="Shirts")[0]
+    return Product.objects.create(
+        name=name, category=category, description="A shirt.", regular_price=price, stock=stock
+    )
+
+
+def create_user(email="customer@example.com", **fields):
+    return User.objects.create_user(
+        email=email,
+        username=email.split("@")[0],
+        password=PASSWORD,
+        first_name="Test",
+        last_name="User",
+        **fields,
+    )
+
+
+class LoginTests(TestCase):
+    def test_login_with_outdated_password_hash(self):
+        # Django upgrades the hash (a save) while checking the password, before the token is made.
+        user = create_user()
+        hasher = PBKDF2PasswordHasher()
+        User.objects.filter(id=user.id).update(
+            password=hasher.encode(PASSWORD, hasher.salt(), iterations=1000)
+        )
+
+        response = APIClient().post(
+            "/api/token/", {"email": user.email, "password": PASSWORD}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertNotIn("$1000$", user.password)
+        token = AccessToken(response.data["access"])
+        self.assertEqual(token["claims_version"], user.claims_version)
+
+    def test_saving_a_user_bumps_claims_version(self):
+        user = create_user()
+        version = user.claims_version
+
+        user.first_name = "Changed"
+        user.save()
+
+        self.assertEqual(user.claims_version, version + 1)
+        self.assertEqual(User.objects.get(id=user.id).claims_version, version + 1)
+
+
+class UsernameTests(TestCase):
+    def register(self, email, first_name="Md", last_name="Rahman"):
+        return APIClient().post(
+            "/api/register/user/",
+            {
+                "first_name": first_name,
+                "last_name": last_name,
+                "email": email,
+                "phone": "0123",
+                "address": "Dhaka",
+                "password": PASSWORD,
+            },
+            format="json",
+        )
+
+    def test_taken_names_get_the_next_suffix(self):
+        for i in range(4):
+            self.assertEqual(self.register(f"rahman{i}@example.com").status_code, 201)
+
+        self.assertEqual(
+            list(User.objects.order_by("id").values_list("username", flat=True)),
+            ["md.rahman", "md.rahman.1", "md.rahman.2", "md.rahman.3"],
+        )
+
+    def test_suffix_follows_the_highest_one_in_use(self):
+        for username in ["md.rahman", "md.rahman.2", "md.rahman.10", "md.rahman.x", "md.rahman.3.1", "md.rahmanx.20"]:
+            User.objects.create_user(f"{uuid.uuid4().hex}@example.com", PASSWORD, username=username)
+
+        self.assertEqual(User.objects.get_free_username("md.rahman"), "md.rahman.11")
+        self.assertEqual(User.objects.get_free_username("md.rahmanx"), "md.rahmanx")
+
+    def test_regex_metacharacters_are_matched_literally(self):
+        for username in ["a+b.c*d", "a+b.c*d.7", "aab.ccd.9", "a.b.4"]:
+            User.objects.create_user(f"{uuid.uuid4().hex}@example.com", PASSWORD, username=username)
+
+        self.assertEqual(User.objects.get_free_username("a+b.c*d"), "a+b.c*d.8")
+        self.assertEqual(User.objects.get_free_username("a+b"), "a+b")
+        self.assertEqual(User.objects.get_free_username("a.b"), "a.b")
+
+    def test_a_name_taken_in_between_is_retried(self):
+        # Another signup took md.rahman after get_free_username picked it.
+        User.objects.create_user("first@example.com", PASSWORD, username="md.rahman")
+        with mock.patch.object(
+            User.objects, "get_free_username", side_effect=["md.rahman", "md.rahman.1"]
+        ) as get_free_username:
+            user = User.objects.create_user_with_free_username(
+                "md.rahman", "second@example.com", PASSWORD
+            )
+
+        self.assertEqual(user.username, "md.rahman.1")
+        self.assertEqual(get_free_username.call_count, 2)
+
+    def test_other_integrity_errors_are_not_retried(self):
+        create_user("taken@example.com")
+        with mock.patch.object(
+            User.objects, "get_free_username", wraps=User.objects.get_free_username
+        ) as get_free_username, self.assertRaises(IntegrityError):
+            User.objects.create_user_with_free_username("md.rahman", "taken@example.com", PASSWORD)
+
+        self.assertEqual(get_free_username.call_count, 1)
+
+
+def token_client(user):
+    client = APIClient()
+    token = MyTokenObtainPairSerializer.get_token(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+    return client
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+    # The budgets don't include authentication, even when the claims version isn't cached.
+    def test_one_query_views_with_a_token(self):
+        client = token_client(create_user("admin@example.com", is_admin=True, is_moderator=True))
+        product = create_product()
+        for path in [f"/api/availability/?ids={product.id}", "/api/qna_queue/", "/api/analytics/sales/"]:
+            with self.subTest(path=path):
+                cache.clear()
+                self.assertEqual(client.get(path).status_code, 200)
+
+
+class EagerLoadingTests(TestCase):
+    # The nested serializers' relations come with the rows, a page of 12 costs the same queries as a page of one.
+    def setUp(self):
+        cache.clear()
+        self.staff = create_user("staff@example.com", is_admin=True, is_moderator=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.product = create_product()
+        self.order = Order.objects.create(payment_method="COD")
+        self.rows = 0
+
+    def add_rows(self, count):
+        for i in range(self.rows, self.rows + count):
+            customer = create_user(f"customer{i}@example.com")
+            other = create_product(f"Shirt {i}", category=self.product.category)
+            ProductSize.objects.create(product=self.product, size=f"S{i}", available_quantity=1)
+            Review.objects.create(user=customer, product=self.product, rating=5, review="Nice.")
+            QnA.objects.create(user=customer, product=self.product, question="Cotton?")
+            WishList.objects.create(user=self.staff, product=other)
+            OrderItem.objects.create(order=self.order, product=other, quantity=1, size="M", price=100)
+        self.rows += count
+
+    def count_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        expected = {
+            f"/api/get_reviews/{self.product.slug}/": 3,
+            f"/api/qna/{self.product.slug}/": 2,
+            "/api/unanswered_questions/": 2,
+            "/api/wishlist/": 1,
+            f"/api/get_order_items/{self.order.id}/": 1,
+            f"/api/get_available_sizes/{self.product.id}/": 2,
+        }
+        self.add_rows(1)
+        one_row = {path: self.count_queries(path) for path in expected}
+        self.add_rows(11)
+        twelve_rows = {path: self.count_queries(path) for path in expected}
+
+        self.assertEqual(one_row, expected)
+        self.assertEqual(twelve_rows, expected)
+
+    def test_nested_data(self):
+        self.add_rows(2)
+
+        reviews = self.client.get(f"/api/get_reviews/{self.product.slug}/").data["results"]
+        items = self.client.get(f"/api/get_order_items/{self.order.id}/").data
+
+        self.assertEqual(reviews[0]["user"]["email"], "customer1@example.com")
+        self.assertEqual(reviews[0]["product"]["category"]["name"], "Shirts")
+        self.assertEqual([item["product"]["name"] for item in items], ["Shirt 0", "Shirt 1"])
+        self.assertEqual(items[0]["order"]["id"], self.order.id)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_user("admin@example.com", is_admin=True))
+        statuses = ["Pending", "Shipped", "Delivered"]
+        self.orders = [Order.objects.create(status=statuses[i % 3]) for i in range(20)]
+
+    def test_pages_follow_on(self):
+        response = self.client.get("/api/orders/?cursor=&count=true")
+        ids = [order["id"] for order in response.data["results"]]
+        self.assertEqual(response.data["count"], 20)
+        self.assertEqual(len(ids), 12)
+
+        response = self.client.get(response.data["next"])
+        ids += [order["id"] for order in response.data["results"]]
+
+        self.assertIsNone(response.data["next"])
+        pending = [order.id for order in reversed(self.orders) if order.status == "Pending"]
+        others = [order.id for order in reversed(self.orders) if order.status != "Pending"]
+        self.assertEqual(ids, pending + others)
+
+    def test_invalid_cursors(self):
+        for cursor in [
+            "not base64!",
+            encode_cursor([True]),
+            encode_cursor([{"a": 1}, 1]),
+            encode_cursor([True, "x"]),
+            encode_cursor([True, None]),
+            encode_cursor([[1], 1]),
+        ]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f"/api/orders/?cursor={cursor}").status_code, 404)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_user("admin@example.com", is_admin=True))
+        self.product = create_product()
+        self.orders = []
+        for day, order_status in [(1, "Pending"), (2, "Pending"), (2, "Shipped"), (3, "Pending")]:
+            order = Order.objects.create(status=order_status, username=f"buyer{day}")
+            Order.objects.filter(id=order.id).update(date_ordered=timezone.make_aware(datetime(2026, 5, day, 12)))
+            self.orders.append(order)
+        for size in ["M", "L"]:
+            OrderItem.objects.create(order=self.orders[1], product=self.product, quantity=1, size=size, price=100)
+
+    def export(self, query):
+        response = self.client.get(f"/api/export_orders/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+    def test_filtered_csv(self):
+        rows = self.export("from=2026-05-02&to=2026-05-03&status=Pending")
+
+        self.assertEqual(
+            [(row["order_id"], row["size"], row["product_name"]) for row in rows],
+            [
+                (str(self.orders[1].id), "M", "Shirt"),
+                (str(self.orders[1].id), "L", "Shirt"),
+                (str(self.orders[3].id), "", ""),
+            ],
+        )
+        self.assertEqual({row["status"] for row in rows}, {"Pending"})
+
+    def test_invalid_dates(self):
+        self.assertEqual(self.client.get("/api/export_orders/?from=May 2").status_code, 400)
+
+
+class SalesReportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_user("admin@example.com", is_admin=True))
+        self.product = create_product()
+        other = create_product("Other shirt", category=self.product.category)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(payment_method="COD")
+            OrderItem.objects.create(order=order, product=self.product, quantity=2, size="M", price=200)
+            OrderItem.objects.create(order=order, product=other, quantity=1, size="M", price=100)
+            order.save()
+
+    def test_one_product_by_category(self):
+        response = self.client.get(f"/api/analytics/sales/?by=category&product={self.product.id}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["category_id"], self.product.category_id)
+        self.assertEqual(response.data["units"], 2)
+        self.assertEqual(response.data["revenue"], 200)
+
+    def test_by_category(self):
+        response = self.client.get("/api/analytics/sales/?by=category")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["units"], 3)
+
+    def test_non_positive_limit(self):
+        for limit in ["0", "-1"]:
+            with self.subTest(limit=limit):
+                response = self.client.get(f"/api/analytics/sales/?by=product&limit={limit}")
+                self.assertEqual(response.status_code, 400)
+
+
+class WishListTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = token_client(self.user)
+        self.products = [create_product(f"Shirt {i}") for i in range(3)]
+
+    def test_put_and_delete_can_be_repeated(self):
+        product = self.products[0]
+        for _ in range(2):
+            response = self.client.put(f"/api/wishlist/items/{product.id}/")
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(WishList.objects.values_list("user", "product")), [(self.user.id, product.id)])
+
+        for _ in range(2):
+            response = self.client.delete(f"/api/wishlist/items/{product.id}/")
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse(WishList.objects.exists())
+
+    def test_put_an_unknown_product(self):
+        response = self.client.put("/api/wishlist/items/999999/")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(WishList.objects.exists())
+
+    def test_membership_by_ids_and_slugs(self):
+        first, second, third = self.products
+        WishList.objects.create(user=self.user, product=first)
+        WishList.objects.create(user=create_user("other@example.com"), product=second)
+
+        response = self.client.get(f"/api/wishlist/contains/?ids={first.id},{second.id},{third.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["wishlist"], {first.id: True, second.id: False, third.id: False})
+
+        response = self.client.get(f"/api/wishlist/contains/?slugs={first.slug},{second.slug},missing")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["wishlist"], {first.slug: True, second.slug: False, "missing": False})
+
+    def test_membership_bad_requests(self):
+        too_many = ",".join(str(i) for i in range(101))
+        for query in ["", "?ids=1,a", f"?ids={too_many}"]:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f"/api/wishlist/contains/{query}").status_code, 400)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.shirt, self.hat = create_product("Shirt"), create_product("Hat")
+        ProductSize.objects.create(product=self.shirt, size="M", available_quantity=5)
+        ProductSize.objects.create(product=self.shirt, size="L", available_quantity=0)
+        self.path = f"/api/availability/?ids={self.hat.id},{self.shirt.id}"
+
+    def test_sizes_of_every_product(self):
+        response = self.client.get(self.path)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["availability"], {self.shirt.id: {"M": 5, "L": 0}, self.hat.id: {}}
+        )
+
+    def test_matching_etag_gets_a_304_without_queries(self):
+        etag = self.client.get(self.path)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        # The ids are a set, their order doesn't matter.
+        response = self.client.get(
+            f"/api/availability/?ids={self.shirt.id},{self.hat.id},{self.shirt.id}", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_once_stock_is_reduced(self):
+        etag = self.client.get(self.path)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reduce_stock([StockLine(self.shirt.id, "M", 2)])
+
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["availability"][self.shirt.id], {"M": 3, "L": 0})
+
+    def test_bad_ids(self):
+        too_many = ",".join(str(i) for i in range(101))
+        for query in ["", "?ids=", "?ids=1,a", f"?ids={too_many}"]:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f"/api/availability/{query}").status_code, 400)
+
+
+def later(seconds):
+    # Moves the local memory cache's clock forward.
+    return mock.patch("time.time", return_value=time.time() + seconds)
+
+
+@override_settings(CACHE_VERSION_TIMEOUT=60)
+class VersionTimeoutTests(TestCase):
+    # Another worker's change (an update without signals here) bumps its own cache's tokens, not this one's.
+    def setUp(self):
+        cache.clear()
+        self.product = create_product()
+
+    def test_serialized_products_expire(self):
+        self.assertEqual(serialize_products([self.product.id])[0]["name"], "Shirt")
+        Product.objects.filter(id=self.product.id).update(name="Changed")
+
+        self.assertEqual(serialize_products([self.product.id])[0]["name"], "Shirt")
+        with later(61):
+            self.assertEqual(serialize_products([self.product.id])[0]["name"], "Changed")
+
+    def test_leaderboards_expire(self):
+        self.assertEqual(leaderboards.get_product_ids("top"), [self.product.id])
+        other = create_product("Best seller", category=self.product.category)
+        Product.objects.filter(id=other.id).update(sold=10)
+
+        self.assertEqual(leaderboards.get_product_ids("top"), [self.product.id])
+        with later(61):
+            self.assertEqual(leaderboards.get_product_ids("top"), [other.id, self.product.id])
+
+    def test_conditional_stamps_expire(self):
+        path = f"/api/product/{self.product.slug}/"
+        etag = self.client.get(path)["ETag"]
+
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with later(61):
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_claims_versions_expire(self):
+        client = token_client(create_user("admin@example.com", is_admin=True))
+        self.assertEqual(client.get("/api/get_moderators/").data, [])
+        User.objects.filter(email="admin@example.com").update(
+            is_admin=False, claims_version=F("claims_version") + 1
+        )
+
+        self.assertEqual(client.get("/api/get_moderators/").data, [])
+        with later(61):
+            self.assertEqual(client.get("/api/get_moderators/").data, {"error": "You are not authorized!"})
+
+
+class ProductDetailTests(TestCase):
+    def test_product_deleted_while_serializing(self):
+        product = create_product()
+        cache.clear()
+
+        with mock.patch("api.views.serialize_products", return_value=[]):
+            response = APIClient().get(f"/api/product/{product.slug}/")
+
+        self.assertEqual(response.status_code, 404)
+
+
+class RatingTests(TestCase):
+    def rating_values(self, product):
+        product.refresh_from_db()
+        return [
+            product.total_ratings,
+            product.total_reviews,
+            product.avg_rating,
+            [getattr(product, f"ratings_{star}") for star in range(1, 6)],
+        ]
+
+    def test_create_review_updates_the_totals_and_histogram(self):
+        product = create_product()
+        order = Order.objects.create(payment_method="COD")
+        for i, rating in enumerate([5, 4, 4]):
+            user = create_user(f"reviewer{i}@example.com")
+            EligibleReviewer.objects.create(user=user, product=product, order=order)
+            response = token_client(user).post(
+                f"/api/create_review/{product.slug}/", {"review": "Nice.", "rating": rating}, format="json"
+            )
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.rating_values(product), [13, 3, 13 / 3, [0, 0, 0, 2, 1]])
+
+    def test_reviewing_without_buying_changes_nothing(self):
+        product = create_product()
+        response = token_client(create_user()).post(
+            f"/api/create_review/{product.slug}/", {"review": "Nice.", "rating": 5}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.rating_values(product), [0, 0, 0, [0, 0, 0, 0, 0]])
+
+    def test_repair_ratings_rebuilds_from_reviews(self):
+        reviewed, unreviewed, correct = create_product("A"), create_product("B"), create_product("C")
+        user = create_user()
+        for rating in [1, 3, 3]:
+            Review.objects.create(user=user, product=reviewed, rating=rating, review="Ok.")
+        Review.objects.create(user=user, product=correct, rating=2, review="Meh.")
+        Product.objects.filter(id=reviewed.id).update(total_ratings=50, total_reviews=10, avg_rating=5, ratings_5=10)
+        Product.objects.filter(id=unreviewed.id).update(total_ratings=4, total_reviews=1, avg_rating=4, ratings_4=1)
+        Product.objects.filter(id=correct.id).update(total_ratings=2, total_reviews=1, avg_rating=2, ratings_2=1)
+
+        out = io.StringIO()
+        call_command("repair_ratings", stdout=out)
+
+        self.assertIn("Fixed 2 products.", out.getvalue())
+        self.assertEqual(self.rating_values(reviewed), [7, 3, 7 / 3, [1, 0, 2, 0, 0]])
+        self.assertEqual(self.rating_values(unreviewed), [0, 0, 0, [0, 0, 0, 0, 0]])
+        self.assertEqual(self.rating_values(correct), [2, 1, 2, [0, 1, 0, 0, 0]])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.shirts = Category.objects.create(name="Shirts")
+        self.shirt = create_product("Blue Shirt", category=self.shirts)
+        self.polo = create_product("Polo", category=self.shirts)
+        # Every product's description is "A shirt.".
+        self.hat = create_product("Straw Hat", category=Category.objects.create(name="Hats"))
+
+    def search(self, query):
+        response = self.client.get("/api/search/", {"query": query})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [product["id"] for product in response.data["results"]]
+
+    def test_prefix_matching_and_ranking(self):
+        # The name counts more than the category, which counts more than the description.
+        self.assertEqual(self.search("shi"), [self.shirt.id, self.polo.id, self.hat.id])
+        self.assertEqual(self.search("blue sh"), [self.shirt.id])
+        self.assertEqual(self.search("hat straw"), [self.hat.id])
+        self.assertEqual(self.search("socks"), [])
+
+    def test_query_operators_are_matched_as_words(self):
+        for query in ['"', '"shirt', 'shirt"', "NEAR(", "NEAR(blue shirt)", "*", "shi*", "AND", "blue AND",
+                      "OR polo", "NOT", "-polo", "name:polo", "^polo", "(polo", "polo)", "'", "{polo}"]:
+            with self.subTest(query=query):
+                self.search(query)
+
+        self.assertEqual(self.search('"Blue" AND'), [])
+        self.assertEqual(self.search("NEAR(blue shirt)"), [])
+        self.assertEqual(self.search('"blue* shirt"'), [self.shirt.id])
+        self.assertEqual(self.search("name:polo"), [])
+        self.assertEqual(self.search("(polo"), [self.polo.id])
+
+    def test_no_query(self):
+        self.assertEqual(self.client.get("/api/search/").status_code, 400)
+
+    def test_renamed_category_is_reindexed(self):
+        self.shirts.name = "Tops"
+        self.shirts.save()
+
+        self.assertCountEqual(self.search("tops"), [self.shirt.id, self.polo.id])
+        self.assertEqual(self.search("shirts"), [])
+
+    def test_rebuild_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_product_fts")
+        self.assertEqual(self.search("polo"), [])
+
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+
+        self.assertIn("Indexed 3 products.", out.getvalue())
+        self.assertEqual(self.search("polo"), [self.polo.id])
+
+
+class CatalogImportTests(TestCase):
+    CATALOG = (
+        "name,category,description,regular_price,discount_price,stock,sizes,intro_image\n"
+        "Shirt,Shirts,A shirt.,100,,0,S:2;M:3,\n"
+        "Jeans,Pants,Blue jeans.,200,150,7,,\n"
+    )
+
+    def import_catalog(self):
+        return import_catalog(io.StringIO(self.CATALOG), log=lambda message: None)
+
+    def test_importing_the_same_file_twice_changes_nothing(self):
+        self.assertEqual(self.import_catalog(), (2, 2, 0))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.import_catalog(), (2, 0, 0))
+
+        writes = [query["sql"] for query in queries if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+        self.assertEqual(writes, [])
+        self.assertEqual(Product.objects.get(slug="shirt").stock, 5)
+
+    def test_bad_csv_sizes(self):
+        for sizes in ["M", "M:x"]:
+            with self.subTest(sizes=sizes):
+                catalog = self.CATALOG + f"Hat,Hats,A hat.,50,,0,{sizes},\n"
+                with self.assertRaisesMessage(CatalogError, "Row 3:"):
+                    import_catalog(io.StringIO(catalog), log=lambda message: None)
+
+    def test_bad_jsonl_line(self):
+        catalog = '{"name": "Shirt", "category": "Shirts", "regular_price": 100, "sizes": {"M": 3}}\n\n{"name": "Jeans",\n'
+        with self.assertRaisesMessage(CatalogError, "Row 2:"):
+            import_catalog(io.StringIO(catalog), "jsonl", log=lambda message: None)
+
+
+def seed_small_dataset(test):
+    benchmarks.seed(
+        users=20, categories=3, products=50, orders=50, reviews=20, questions=20, log=lambda message: None
+    )
+    # The token refresh scenario would load the blacklist filter in a thread, which can't see the test's transaction.
+    patcher = mock.patch.object(tokens.blacklist, "start_loading")
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+# Without the test runner's "testserver" host, like the run_benchmarks command.
+@override_settings(ALLOWED_HOSTS=[])
+class BenchmarkTests(TestCase):
+    # The payment callbacks send the customer back to the frontend.
+    REDIRECTS = {"payment_success", "payment_fail", "payment_cancel"}
+
+    def setUp(self):
+        seed_small_dataset(self)
+
+    def test_scenarios_succeed(self):
+        ctx = benchmarks.get_context()
+
+        with benchmarks.isolated():
+            for scenario in benchmarks.get_scenarios():
+                with self.subTest(scenario=scenario[0]):
+                    result = benchmarks.run_scenario(ctx, scenario, iterations=1)
+                    if scenario[0] in self.REDIRECTS:
+                        self.assertEqual(result["status"], 302)
+                    else:
+                        self.assertTrue(200 <= result["status"] < 300, result)
+
+    def test_work_on_commit_is_measured(self):
+        ctx = benchmarks.get_context()
+        scenario = benchmarks.get_scenarios(["place_order"])[0]
+
+        with benchmarks.isolated(), mock.patch("api.sales.record_order") as record_order:
+            benchmarks.request(benchmarks.get_client(ctx, "customer"), "post", "/api/place_order/", scenario[4], ctx)
+
+        record_order.assert_called_once()
+
+
+class QueryPlanTests(TestCase):
+    # On a small seeded database: sqlite without ANALYZE statistics plans for big tables, like production's.
+    def setUp(self):
+        seed_small_dataset(self)
+
+    def test_no_full_scans(self):
+        log = []
+
+        failures = queryplans.check(log=log.append)
+
+        self.assertEqual(failures, 0, "\n".join(log))
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f"in-{i}")
+
+        self.assertTrue(all(f"in-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"out-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+@override_settings(TOKEN_BLACKLIST_SYNC_INTERVAL=60)
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.blacklist = Blacklist()
+        self.blacklist.load()
+
+    def blacklisted_token(self):
+        token = RefreshToken.for_user(self.user)
+        token.blacklist()
+        return token["jti"]
+
+    def expired_token(self):
+        token = OutstandingToken.objects.create(
+            user=self.user, jti=uuid.uuid4().hex, token="expired", expires_at=timezone.now() - timedelta(days=1)
+        )
+        BlacklistedToken.objects.create(token=token)
+        return token.jti
+
+    def test_a_miss_needs_no_query_between_syncs(self):
+        jti = self.blacklisted_token()
+        self.assertTrue(self.blacklist.is_blacklisted(jti))
+
+        with self.assertNumQueries(0):
+            self.assertFalse(self.blacklist.is_blacklisted(uuid.uuid4().hex))
+
+    def test_tokens_blacklisted_elsewhere_are_read_at_the_next_sync(self):
+        self.blacklist.sync()
+        jti = self.blacklisted_token()
+
+        self.assertFalse(self.blacklist.is_blacklisted(jti))
+        self.blacklist.synced_at -= 60
+        self.assertTrue(self.blacklist.is_blacklisted(jti))
+
+    def test_prune_and_rebuild(self):
+        expired = self.expired_token()
+        live = self.blacklisted_token()
+        self.blacklist.load()
+        self.assertIn(live, self.blacklist.bloom)
+
+        self.assertEqual(prune_tokens(), 1)
+
+        self.assertFalse(OutstandingToken.objects.filter(jti=expired).exists())
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=live).exists())
+        self.blacklist.load()
+        self.assertNotIn(expired, self.blacklist.bloom)
+        self.assertTrue(self.blacklist.is_blacklisted(live))
+
+    def test_stale_filter_is_rebuilt(self):
+        with mock.patch.object(self.blacklist, "start_loading") as start_loading:
+            self.blacklist.is_blacklisted(uuid.uuid4().hex)
+            start_loading.assert_not_called()
+
+            with override_settings(TOKEN_BLACKLIST_REBUILD_INTERVAL=0):
+                self.blacklist.is_blacklisted(uuid.uuid4().hex)
+            start_loading.assert_called_once()
+
+
+def fail(**payload):
+    raise ValueError("Mailgun is down.")
+
+
+@override_settings(EMAIL_TRANSPORT="api.emails.StubTransport", TASK_RETRY_DELAY=30, TASK_LEASE=300)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        StubTransport.outbox.clear()
+        patcher = mock.patch.dict(TASKS, {"fail": fail})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_emails_are_delivered_by_the_worker(self):
+        send_email("Test", "User", "customer@example.com", "Order placed", "Thanks!")
+        self.assertEqual(StubTransport.outbox, [])
+
+        call_command("run_tasks", "--once", stdout=io.StringIO())
+
+        self.assertEqual(
+            StubTransport.outbox,
+            [{"to": "Test User <customer@example.com>", "subject": "Order placed", "text": "Thanks!"}],
+        )
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts, task.locked_until), ("done", 1, None))
+        self.assertIsNotNone(task.finished)
+
+    def test_a_task_is_claimed_once(self):
+        task = enqueue("fail")
+        now = timezone.now()
+
+        self.assertEqual(claim(task.id, now).status, "running")
+        self.assertIsNone(claim(task.id, now))
+        self.assertEqual(run_due_tasks(), 0)
+
+    def test_an_expired_lease_is_claimed_again(self):
+        task = enqueue("fail")
+        claim(task.id, timezone.now())
+
+        self.assertIsNone(claim(task.id, timezone.now() + timedelta(seconds=299)))
+        task = claim(task.id, timezone.now() + timedelta(seconds=301))
+        self.assertEqual((task.status, task.attempts), ("running", 2))
+
+    def test_failed_tasks_are_retried_later_then_dead(self):
+        task = enqueue("fail", to="customer@example.com")
+        delays = []
+        for attempt in range(1, task.max_attempts + 1):
+            now = timezone.now()
+            with mock.patch("django.utils.timezone.now", return_value=now):
+                self.assertEqual(run_due_tasks(), 1)
+                # Not due again until the delay has passed.
+                self.assertEqual(run_due_tasks(), 0)
+            task.refresh_from_db()
+            self.assertEqual(task.attempts, attempt)
+            self.assertIn("Mailgun is down.", task.last_error)
+            if task.status == "pending":
+                delays.append((task.run_at - now).total_seconds())
+                Task.objects.filter(id=task.id).update(run_at=timezone.now())
+
+        self.assertEqual(delays, [30, 60, 120, 240])
+        self.assertEqual(task.status, "dead")
+        self.assertIsNotNone(task.finished)
+        self.assertEqual(run_due_tasks(), 0)
+
+    def test_unknown_tasks_are_dead_at_once(self):
+        task = enqueue("missing")
+
+        self.assertEqual(run_due_tasks(), 1)
+
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("dead", 1))
+        self.assertIn('No task named "missing"', task.last_error)
+
+
+class ModerationQueueTests(TestCase):
+    def setUp(self):
+        self.moderator = create_user("moderator@example.com", is_moderator=True)
+        self.other_moderator = create_user("other@example.com", is_moderator=True)
+        self.customer = create_user()
+        self.product = create_product()
+        self.questions = [
+            QnA.objects.create(user=self.customer, product=self.product, question=f"Question {i}?")
+            for i in range(3)
+        ]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def claim(self, user, size):
+        response = self.client_for(user).post("/api/qna_queue/claim/", {"size": size}, format="json")
+        self.assertEqual(response.status_code, 200)
+        return [question["id"] for question in response.data["results"]]
+
+    def emails(self):
+        return Task.objects.filter(name="deliver_email").count()
+
+    def test_depth(self):
+        response = self.client_for(self.moderator).get("/api/qna_queue/")
+
+        self.assertEqual(response.data, {"unanswered": 3})
+        self.assertEqual(self.client_for(self.customer).get("/api/qna_queue/").status_code, 403)
+
+    def test_moderators_claim_different_questions(self):
+        ids = [qna.id for qna in self.questions]
+
+        self.assertEqual(self.claim(self.moderator, 2), ids[:2])
+        self.assertEqual(self.claim(self.other_moderator, 2), ids[2:])
+        self.assertEqual(self.claim(self.other_moderator, 2), [])
+
+    def test_expired_claims_are_claimable_again(self):
+        ids = self.claim(self.moderator, 3)
+
+        with mock.patch("django.utils.timezone.now", return_value=timezone.now() + timedelta(seconds=601)):
+            self.assertEqual(self.claim(self.other_moderator, 3), ids)
+
+    def test_answer_claimed(self):
+        ids = self.claim(self.moderator, 2)
+        self.claim(self.other_moderator, 1)
+        answers = [{"id": qna_id, "answer": "Yes."} for qna_id in ids + [self.questions[2].id]]
+
+        response = self.client_for(self.moderator).post(
+            "/api/qna_queue/answer/", {"answers": answers, "release": "all"}, format="json"
+        )
+
+        self.assertEqual(response.data["answered"], ids)
+        self.assertEqual(response.data["skipped"], [self.questions[2].id])
+        self.assertEqual(response.data["unanswered"], 1)
+        self.assertEqual(self.emails(), 2)
+
+    def test_question_held_by_another_moderator(self):
+        qna_id = self.claim(self.other_moderator, 1)[0]
+
+        response = self.client_for(self.moderator).post(f"/api/add_answer/{qna_id}/", {"answer": "Yes."})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNone(QnA.objects.get(id=qna_id).answer)
+
+    def test_editing_an_answer_sends_no_email(self):
+        client = self.client_for(self.moderator)
+        qna_id = self.questions[0].id
+
+        self.assertEqual(client.post(f"/api/add_answer/{qna_id}/", {"answer": "Yes."}).status_code, 201)
+        self.assertEqual(client.post(f"/api/add_answer/{qna_id}/", {"answer": "Yes!"}).status_code, 201)
+
+        self.assertEqual(QnA.objects.get(id=qna_id).answer, "Yes!")
+        self.assertEqual(self.emails(), 1)
+        self.assertEqual(moderation.get_unanswered_count(), 2)
+
+    def test_counter_upkeep(self):
+        QnA.objects.create(user=self.customer, product=self.product, question="Answered?", answer="Yes.")
+        self.assertEqual(moderation.get_unanswered_count(), 3)
+
+        self.questions[0].delete()
+        self.assertEqual(moderation.get_unanswered_count(), 2)
+
+        Counter.objects.filter(name=moderation.UNANSWERED_COUNTER).update(value=10)
+        self.assertEqual(moderation.repair_unanswered_count(), 2)
+        self.assertEqual(moderation.get_unanswered_count(), 2)
+
+
+class RendererTests(TestCase):
+    def test_wide_integers_fall_back_to_json(self):
+        self.assertEqual(ORJSONRenderer().render({"id": 2**70}), b'{"id":1180591620717411303424}')
+
+
+def order_line(product, size="M", quantity=1):
+    return {
+        "productData": {
+            "id": product.id,
+            "regular_price": product.regular_price,
+            "discount_price": product.discount_price,
+        },
+        "quantity": quantity,
+        "size": [{"size": size}],
+    }
+
+
+class StubGateway(payments.Gateway):
+    def __init__(self):
+        super().__init__()
+        self.down = False
+
+    def request_session(self, post_body):
+        if self.down:
+            raise ConnectionError("Gateway down.")
+        return {"status": "SUCCESS", "GatewayPageURL": f"https://pay.example.com/{post_body['tran_id']}"}
+
+
+@override_settings(PAYMENT_BREAKER_THRESHOLD=3, PAYMENT_BREAKER_RESET=30)
+class PaymentGatewayTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("api.payments.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gateway = StubGateway()
+
+    def create_session(self):
+        return self.gateway.create_session({"tran_id": "t1"})
+
+    def fail_calls(self, times):
+        self.gateway.down = True
+        for _ in range(times):
+            with self.assertRaises(payments.GatewayError):
+                self.create_session()
+
+    def test_failures_in_a_row_open_the_circuit(self):
+        self.fail_calls(2)
+        self.assertEqual(self.gateway.breaker.state, "closed")
+        self.fail_calls(1)
+        self.assertEqual(self.gateway.breaker.state, "open")
+
+        # Refused without calling the gateway, even once it's back.
+        self.gateway.down = False
+        with mock.patch.object(self.gateway, "request_session") as request_session:
+            with self.assertRaises(payments.GatewayUnavailable):
+                self.create_session()
+        request_session.assert_not_called()
+        metrics = self.gateway.get_metrics()
+        self.assertEqual([metrics["requests"], metrics["errors"], metrics["rejected"]], [3, 3, 1])
+        self.assertEqual(metrics["circuit"], "open")
+
+    def test_a_success_resets_the_failure_count(self):
+        self.fail_calls(2)
+        self.gateway.down = False
+        self.create_session()
+        self.fail_calls(2)
+
+        self.assertEqual(self.gateway.breaker.state, "closed")
+
+    def test_half_open_lets_one_trial_through(self):
+        self.fail_calls(3)
+        self.now += 30
+        self.assertEqual(self.gateway.breaker.state, "half-open")
+
+        breaker = self.gateway.breaker
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_a_failed_trial_opens_the_circuit_again(self):
+        self.fail_calls(3)
+        self.now += 30
+        self.fail_calls(1)
+
+        self.assertEqual(self.gateway.breaker.state, "open")
+        self.now += 29
+        with self.assertRaises(payments.GatewayUnavailable):
+            self.create_session()
+        self.now += 1
+        self.gateway.down = False
+        self.assertEqual(self.create_session()["status"], "SUCCESS")
+        self.assertEqual(self.gateway.breaker.state, "closed")
+
+    def place_online_order(self):
+        product = create_product()
+        ProductSize.objects.create(product=product, size="M", available_quantity=5)
+        with mock.patch("api.views.get_gateway", return_value=self.gateway):
+            return APIClient().post(
+                "/api/place_order/",
+                {
+                    "order": {
+                        "first_name": "Test",
+                        "last_name": "User",
+                        "email": "customer@example.com",
+                        "phone": "0123",
+                        "address": "Dhaka",
+                        "username": "customer",
+                    },
+                    "shipping_charge": 120,
+                    "payment_method": "online",
+                    "outside_comilla": True,
+                    "order_items": [order_line(product)],
+                },
+                format="json",
+            )
+
+    def test_checkout_fails_fast_while_the_circuit_is_open(self):
+        self.fail_calls(3)
+
+        response = self.place_online_order()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(
+            response.data["error"], "Online payment is unavailable right now. Please try again later."
+        )
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_checkout_with_a_failing_gateway(self):
+        self.gateway.down = True
+
+        response = self.place_online_order()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "Payment gateway error.")
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_checkout_with_a_working_gateway(self):
+        response = self.place_online_order()
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(response.data["GatewayPageURL"], f"https://pay.example.com/{order.transaction_id}")
+
+
+# Not in a test transaction, so the work run on commit (sales totals, leaderboards, cache versions) is part of the
+# request, as it is in production.
+@override_settings(QUERY_BUDGET_STRICT=True)
+class PlaceOrderTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.products = [create_product(f"Shirt {i}", stock=10) for i in range(30)]
+        for product in self.products:
+            for size in ["M", "L"]:
+                ProductSize.objects.create(product=product, size=size, available_quantity=5)
+
+    def place_order(self, lines):
+        return self.client.post(
+            "/api/place_order/",
+            {
+                "order": {"first_name": "Test", "last_name": "User", "address": "Comilla", "username": "customer"},
+                "shipping_charge": 60,
+                "payment_method": "COD",
+                "outside_comilla": False,
+                "order_items": lines,
+            },
+            format="json",
+        )
+
+    def count_queries(self, lines):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.place_order(lines)
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(queries)
+
+    def test_a_large_cart_stays_in_budget(self):
+        one_line = self.count_queries([order_line(self.products[0], "M")])
+        lines = [order_line(product, size) for product in self.products for size in ["M", "L"]]
+
+        self.assertEqual(self.count_queries(lines), one_line)
+        self.assertEqual(OrderItem.objects.count(), 61)
+        self.assertEqual(set(ProductSize.objects.values_list("available_quantity", flat=True)[1:]), {4})
+        self.assertEqual(ProductSize.objects.get(product=self.products[0], size="M").available_quantity, 3)
+        self.assertEqual(set(Product.objects.values_list("stock", "sold")[1:]), {(8, 2)})
+        self.assertEqual(sum(ProductSales.objects.values_list("units", flat=True)), 61)
+
+    def test_a_short_size_changes_nothing(self):
+        # Bought by someone else after the cart was validated.
+        lines = [order_line(product) for product in self.products]
+        cart = load_cart(lines)
+        ProductSize.objects.filter(product=self.products[-1], size="M").update(available_quantity=0)
+
+        with mock.patch("api.views.load_cart", side_effect=[cart, load_cart(lines)]):
+            response = self.place_order(lines)
+
+        self.assertIn("error", response.data)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(ProductSize.objects.filter(size="M", available_quantity=5).count(), 29)
+        self.assertEqual(set(Product.objects.values_list("stock", "sold")), {(10, 0)})
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    STOCK = 5
+    BUYERS = 12
+
+    def order_payload(self, product, username):
+        # No email, so no email task is queued after the order.
+        return {
+            "order": {"first_name": "Test", "last_name": "User", "address": "Comilla", "username": username},
+            "shipping_charge": 60,
+            "payment_method": "COD",
+            "outside_comilla": False,
+            "order_items": [
+                {
+                    "productData": {
+                        "id": product.id,
+                        "regular_price": product.regular_price,
+                        "discount_price": product.discount_price,
+                    },
+                    "quantity": 1,
+                    "size": [{"size": "M"}],
+                }
+            ],
+        }
+
+    def load_cart_together(self, barrier):
+        # Every buyer's cart is loaded, and found in stock, before any of them writes and is reused when a request is
+        # retried. Only the stock UPDATEs stand between the buyers and overselling.
+        loaded = threading.local()
+
+        def load(order_items):
+            if not hasattr(loaded, "cart"):
+                loaded.cart = load_cart(order_items)
+                barrier.wait(timeout=10)
+            return loaded.cart
+
+        return load
+
+    def buy(self, product, username, responses, errors):
+        # sqlite's shared in-memory test database doesn't wait for locks, a request that hit one is retried unless
+        # its order was placed (the failure came after the commit).
+        retried = False
+        try:
+            while True:
+                try:
+                    if retried and Order.objects.filter(username=username).exists():
+                        responses[username] = {"success": "Order placed successfully!"}
+                        return
+                    response = APIClient().post(
+                        "/api/place_order/", self.order_payload(product, username), format="json"
+                    )
+                    responses[username] = response.data
+                    return
+                except OperationalError as e:
+                    if "locked" not in str(e):
+                        raise
+                    retried = True
+                    time.sleep(0.01)
+        except Exception as e:
+            errors[username] = e
+        finally:
+            connection.close()
+
+    def test_last_items_are_sold_once(self):
+        product = create_product(stock=self.STOCK)
+        ProductSize.objects.create(product=product, size="M", available_quantity=self.STOCK)
+
+        barrier = threading.Barrier(self.BUYERS)
+        responses = {}
+        errors = {}
+        threads = [
+            threading.Thread(target=self.buy, args=(product, f"buyer{i}", responses, errors))
+            for i in range(self.BUYERS)
+        ]
+        with mock.patch("api.views.load_cart", self.load_cart_together(barrier)):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(responses), self.BUYERS)
+        placed = [username for username, data in responses.items() if "success" in data]
+        self.assertEqual(len(placed), self.STOCK)
+        for username, data in responses.items():
+            if username not in placed:
+                self.assertIn("error", data)
+
+        size = ProductSize.objects.get(product=product, size="M")
+        product.refresh_from_db()
+        self.assertEqual(size.available_quantity, 0)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(product.sold, self.STOCK)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+        self.assertEqual(sorted(Order.objects.values_list("username", flat=True)), sorted(placed))
+        self.assertEqual(
+            sum(OrderItem.objects.filter(product=product).values_list("quantity", flat=True)), self.STOCK
+        )
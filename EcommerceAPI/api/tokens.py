@@ -0,0 +1,242 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework_simplejwt import serializers, tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .cache import LRUCache
+
+# Every token refresh blacklists the old refresh token, so the blacklist keeps growing and is looked up on every
+# refresh. Each process keeps a Bloom filter of the blacklisted jtis: a jti that isn't in it was never blacklisted
+# and needs no query. A jti that is in it (blacklisted, or a false positive) is looked up, and confirmed ones are
+# kept in an LRU. Rows added by other processes are picked up by reading the rows past the newest one seen; with a
+# shared cache that only happens when the blacklist counter in the cache moved, with the local memory cache (one
+# cache per process) at most every TOKEN_BLACKLIST_SYNC_INTERVAL seconds, so a token blacklisted by another worker
+# can be refreshed once more within that window. Expired rows are removed in batches by prune_tokens (prune_tokens
+# command), and the filter, which can only grow, is rebuilt from the unexpired rows every
+# TOKEN_BLACKLIST_REBUILD_INTERVAL seconds to keep its false positive rate down.
+
+VERSION_KEY = "token-blacklist-version"
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def get_positions(self, item):
+        # Double hashing: position i is h1 + i * h2.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.get_positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.get_positions(item)
+        )
+
+
+def new_filter():
+    return BloomFilter(
+        getattr(settings, "TOKEN_BLACKLIST_CAPACITY", 1000000),
+        getattr(settings, "TOKEN_BLACKLIST_ERROR_RATE", 0.01),
+    )
+
+
+# Setting a bit is a read-modify-write of its byte, two threads writing the same byte at once could lose one of the
+# bits, and a lost bit lets a blacklisted token through without a query. Every write to the filter holds the lock.
+class Blacklist:
+    def __init__(self):
+        self.bloom = new_filter()
+        self.confirmed = LRUCache(getattr(settings, "TOKEN_BLACKLIST_LRU_SIZE", 10000))
+        self.last_id = 0
+        self.version = None
+        self.synced_at = None
+        self.built_at = None
+        self.ready = False
+        self.loading = False
+        # jtis blacklisted in this process while a new filter is being built, copied into it when it's done.
+        self.added_while_loading = []
+        self.lock = threading.Lock()
+        self.shared_cache = not settings.CACHES["default"]["BACKEND"].endswith("LocMemCache")
+
+    def load(self):
+        # Builds a new filter from the unexpired rows on the side, checks use the current one (or the database, the
+        # first time) until it replaces it. Rows added while it was loading are read by the next sync.
+        last_id = BlacklistedToken.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        rows = BlacklistedToken.objects.filter(
+            id__lte=last_id, token__expires_at__gt=timezone.now()
+        ).values_list("token__jti", flat=True)
+        bloom = new_filter()
+        for jti in rows.iterator(chunk_size=10000):
+            bloom.add(jti)
+        with self.lock:
+            for jti in self.added_while_loading:
+                bloom.add(jti)
+            self.added_while_loading = []
+            self.bloom = bloom
+            self.last_id = last_id
+            self.version = None
+            self.synced_at = None
+            self.built_at = time.monotonic()
+            self.ready = True
+
+    def load_in_background(self):
+        try:
+            self.load()
+        finally:
+            with self.lock:
+                self.loading = False
+                self.added_while_loading = []
+            connection.close()
+
+    def start_loading(self):
+        with self.lock:
+            if self.loading or (self.ready and not self.is_stale()):
+                return
+            self.loading = True
+        threading.Thread(target=self.load_in_background, daemon=True).start()
+
+    def is_stale(self):
+        interval = getattr(settings, "TOKEN_BLACKLIST_REBUILD_INTERVAL", 6 * 3600)
+        return self.built_at is None or time.monotonic() - self.built_at >= interval
+
+    def expire(self):
+        # The next check starts a rebuild, after prune_tokens deleted rows.
+        with self.lock:
+            self.built_at = None
+
+    def sync(self):
+        now = time.monotonic()
+        if self.shared_cache:
+            version = cache.get(VERSION_KEY)
+            if version is not None and version == self.version:
+                return
+        else:
+            version = None
+            interval = getattr(settings, "TOKEN_BLACKLIST_SYNC_INTERVAL", 5)
+            if self.synced_at is not None and now - self.synced_at < interval:
+                return
+
+        # The rows are read under the lock, so a new filter can't replace this one (and reset last_id) in between.
+        with self.lock:
+            rows = BlacklistedToken.objects.filter(id__gt=self.last_id).values_list("id", "token__jti")
+            for row_id, jti in rows:
+                self.bloom.add(jti)
+                self.last_id = max(self.last_id, row_id)
+            self.version = version
+            self.synced_at = now
+
+    def add(self, jti):
+        with self.lock:
+            self.bloom.add(jti)
+            if self.loading:
+                self.added_while_loading.append(jti)
+        self.confirmed.set_many({jti: True})
+
+    def is_blacklisted(self, jti):
+        if not self.ready:
+            self.start_loading()
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+        if self.is_stale():
+            self.start_loading()
+        self.sync()
+        if jti not in self.bloom:
+            return False
+        if self.confirmed.get_many([jti]):
+            return True
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            self.confirmed.set_many({jti: True})
+            return True
+        return False
+
+
+blacklist = Blacklist()
+
+
+def record_blacklisted(jti):
+    blacklist.add(jti)
+
+    def bump_version():
+        cache.add(VERSION_KEY, 0, timeout=None)
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            pass
+
+    transaction.on_commit(bump_version)
+
+
+class RefreshToken(tokens.RefreshToken):
+    def check_blacklist(self):
+        if blacklist.is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError("Token is blacklisted")
+
+    def get_outstanding_token(self):
+        # Same as simplejwt's, but the user is set by id instead of being loaded first.
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        return OutstandingToken.objects.get_or_create(
+            jti=self.payload[api_settings.JTI_CLAIM],
+            defaults={
+                "user_id": user_id,
+                "created_at": self.current_time,
+                "token": str(self),
+                "expires_at": datetime_from_epoch(self.payload["exp"]),
+            },
+        )
+
+    def blacklist(self):
+        token, _ = self.get_outstanding_token()
+        return BlacklistedToken.objects.get_or_create(token=token)
+
+    def outstand(self):
+        return self.get_outstanding_token()
+
+
+class TokenRefreshSerializer(serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+def prune_tokens(batch_size=5000, log=logger.info):
+    # Expired tokens can't be used anymore, blacklisted or not. Tokens are created in expiry order, so the expired
+    # ones are the oldest ids and each batch is found by walking the primary key from the start.
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=now)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        log(f"{deleted} expired tokens deleted")
+    if deleted:
+        # This process's filter, the other processes drop the deleted jtis at their next scheduled rebuild.
+        blacklist.expire()
+    return deleted
@@ -21,6 +21,7 @@ urlpatterns = [
         views.get_size_specific_stock,
         name="get_size_specific_stock",
     ),
+    path("availability/", views.get_availability, name="get_availability"),
     path("get_categories/", views.CategoryList.as_view(), name="get_categories"),
     path("get_top_products/", views.get_top_products, name="get_top_products"),
 
@@ -44,6 +45,8 @@ urlpatterns = [
         views.change_order_status,
         name="change_order_status",
     ),
+    path("export_orders/", views.export_orders, name="export_orders"),
+    path("analytics/sales/", views.get_sales, name="get_sales"),
     # Utils
     path("get_user_data/<int:user_id>/", views.get_user_data, name="get_user_data"),
     path(
@@ -58,10 +61,15 @@ urlpatterns = [
     path("wishlist/", views.get_wishlist_items, name="get_wishlist_items"),
     path("change_wishlist/<slug:slug>/", views.change_wishlist, name="change_wishlist"),
     path("if_in_wishlist/<slug:slug>/", views.if_in_wishlist, name="if_in_wishlist"),
+    path("wishlist/contains/", views.wishlist_membership, name="wishlist_membership"),
+    path("wishlist/items/<int:product_id>/", views.wishlist_item, name="wishlist_item"),
     # QnA
     path("qna/<slug:slug>/", views.QnAList.as_view()),
     path("add_question/<slug:slug>/", views.add_question, name="add_question"),
     path("add_answer/<int:qna_id>/", views.add_answer, name="add_answer"),
+    path("qna_queue/", views.qna_queue, name="qna_queue"),
+    path("qna_queue/claim/", views.claim_questions, name="claim_questions"),
+    path("qna_queue/answer/", views.answer_questions, name="answer_questions"),
     path(
         "unanswered_questions/",
         views.UnansweredList.as_view(),
@@ -92,6 +100,11 @@ urlpatterns = [
     path("payment/success/", views.payment_success, name="payment_success"),
     path("payment/fail/", views.payment_fail, name="payment_fail"),
     path("payment/cancel/", views.payment_cancel, name="payment_cancel"),
+    path(
+        "payment/metrics/",
+        views.payment_gateway_metrics,
+        name="payment_gateway_metrics",
+    ),
     # Edit product
     path("edit_product/<slug:slug>/", views.edit_product, name="edit_product"),
 ]
\ No newline at end of file
@@ -1,11 +1,10 @@
 from django.db.models import Case, When, Value, CharField
-import os
+import hashlib
+import logging
 from django.shortcuts import redirect
-import requests
-from django.http import HttpResponseBadRequest
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 import uuid
-from sslcommerz_lib import SSLCOMMERZ
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.db.models.signals import post_save
 from django.shortcuts import render, get_object_or_404
@@ -35,6 +34,17 @@ from .serializers import (
     QnASerializer,
 )
 from .serializers import ReviewSerializer
+from .checkout import load_cart, create_order_items
+from .stock import InsufficientStock, StockLine, reduce_stock
+from .search import search_product_ids
+from .cache import get_product_versions, serialize_products
+from .emails import send_email
+from .payments import GatewayError, GatewayUnavailable, get_gateway
+from .middleware import query_budget
+from . import conditional, exports, leaderboards, moderation, sales
+from .ratings import add_rating
+from .tokens import RefreshToken
+from .images import InvalidImage, get_known_variants, queue_variants, store_image
 from rest_framework import generics, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -46,9 +56,32 @@ from rest_framework.exceptions import PermissionDenied
 
 # Create your views here.
 
+logger = logging.getLogger(__name__)
 
-class ProductList(generics.ListCreateAPIView):
+
+class EagerLoadingMixin:
+    # Loads the relations the serializer declares (serializers.EagerLoadingMixin) together with the queryset.
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, "setup_eager_loading"):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+
+class CachedProductListMixin:
+    # Only the product ids come from the database, the serialized products come from the fragment cache.
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset().values_list("id", flat=True)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize_products(page, request))
+        return Response(serialize_products(queryset, request))
+
+
+class ProductList(CachedProductListMixin, generics.ListCreateAPIView):
     serializer_class = ProductSerializer
+    query_budget = 6
 
     def get_queryset(self):
         slug = self.kwargs["slug"]
@@ -88,10 +121,26 @@ class ProductDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     lookup_field = "slug"
+    query_budget = 4
+
+    def retrieve(self, request, *args, **kwargs):
+        product_id = get_object_or_404(
+            Product.objects.values_list("id", flat=True), slug=kwargs["slug"]
+        )
 
+        def build():
+            # Empty if the product was deleted since its id was read.
+            data = serialize_products([product_id], request)
+            if not data:
+                raise Http404("No Product matches the given query.")
+            return Response(data[0])
 
-class SimilarProductList(generics.ListCreateAPIView):
+        return conditional.respond(request, [f"product:{product_id}"], build)
+
+
+class SimilarProductList(CachedProductListMixin, generics.ListCreateAPIView):
     serializer_class = ProductSerializer
+    query_budget = 6
 
     def get_queryset(self):
         slug = self.kwargs["slug"]
@@ -100,18 +149,32 @@ class SimilarProductList(generics.ListCreateAPIView):
         return qs
 
 
-class CategoryList(generics.ListCreateAPIView):
+class CategoryList(conditional.ConditionalListMixin, generics.ListCreateAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    def get_version_scopes(self):
+        return ["categories"]
+
 
-class ReviewList(generics.ListCreateAPIView):
+class ReviewList(conditional.ConditionalListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     serializer_class = ReviewSerializer
+    query_budget = 5
+
+    def get_product_id(self):
+        if not hasattr(self, "product_id"):
+            self.product_id = get_object_or_404(
+                Product.objects.values_list("id", flat=True), slug=self.kwargs["slug"]
+            )
+        return self.product_id
+
+    # The reviews show the product's rating too.
+    def get_version_scopes(self):
+        product_id = self.get_product_id()
+        return [f"product:{product_id}", f"reviews:{product_id}"]
 
     def get_queryset(self):
-        slug = self.kwargs["slug"]
-        product = get_object_or_404(Product, slug=slug)
-        qs = Review.objects.filter(product=product).order_by("-id")
+        qs = Review.objects.filter(product_id=self.get_product_id()).order_by("-id")
         return qs
 
 
@@ -121,11 +184,11 @@ def is_eligible_reviewer(request, slug):
     user = request.user
     if user.is_authenticated:
         product = get_object_or_404(Product, slug=slug)
-        eligible_reviewer = EligibleReviewer.objects.filter(user=user, product=product)
+        eligible_reviewer = EligibleReviewer.objects.filter(user_id=user.id, product=product)
 
         if eligible_reviewer:
             # Check if review already exists
-            review = Review.objects.filter(user=user, product=product)
+            review = Review.objects.filter(user_id=user.id, product=product)
             if review:
                 return Response({"is_eligible": False})
             else:
@@ -148,11 +211,9 @@ def create_review(request, slug):
         else:
             serializer = ReviewSerializer(data=request.data)
             if serializer.is_valid():
-                product.total_ratings += serializer.validated_data["rating"]
-                product.total_reviews += 1
-                product.avg_rating = product.total_ratings / product.total_reviews
-                product.save()
-                serializer.save(user=user, product=product)
+                with transaction.atomic():
+                    serializer.save(user=user, product=product)
+                    add_rating(product.id, serializer.validated_data["rating"])
                 return Response(serializer.data)
             else:
                 return Response(serializer.errors)
@@ -164,10 +225,13 @@ def create_review(request, slug):
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_images(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    images = ProductImage.objects.filter(product=product)
-    serializer = ImageSerializer(images, many=True)
-    return Response(serializer.data)
+    def build():
+        product = get_object_or_404(Product, id=product_id)
+        images = ProductImage.objects.filter(product=product)
+        serializer = ImageSerializer(images, many=True)
+        return Response(serializer.data)
+
+    return conditional.respond(request, [f"product:{product_id}"], build)
 
 
 @api_view(["POST"])
@@ -178,24 +242,37 @@ def upload_images(request, product_id):
         product = get_object_or_404(Product, id=product_id)
         images = request.FILES.getlist("images")
 
-        # Delete all the existing images(for edit) of this product if new images are provided
-        if images:
-            product_images = ProductImage.objects.filter(product=product)
-            for product_image in product_images:
-                product_image.delete()
-
         if not images:
             return JsonResponse({"error": "No images were provided!"})
 
         if len(images) >= 10:
             return JsonResponse({"Error": "More than 10 images is not allowed."})
 
-        for image in images:
-            product_image = ProductImage.objects.create(product=product, image=image)
-            product_image.save()
-
-        product.intro_image = images[0]
-        product.save()
+        # Files are stored under their content hash, a picture that was uploaded before is not stored again and
+        # keeps the variants already made for it. The missing ones are made by the task workers.
+        try:
+            names = [store_image(image) for image in images]
+        except InvalidImage as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        known_variants = get_known_variants(names)
+
+        # The new images replace the existing ones(for edit).
+        with transaction.atomic():
+            ProductImage.objects.filter(product=product).delete()
+            ProductImage.objects.bulk_create(
+                [
+                    ProductImage(
+                        product=product, image=name, variants=known_variants.get(name, {})
+                    )
+                    for name in names
+                ]
+            )
+            product.intro_image = names[0]
+            product.intro_image_variants = known_variants.get(names[0], {})
+            product.save()
+            queue_variants(
+                [name for name in dict.fromkeys(names) if name not in known_variants]
+            )
 
         return JsonResponse({"success": "Images were uploaded successfully!"})
 
@@ -223,6 +300,9 @@ def add_product_sizes(request, product_id):
                 {"error": "Sizes quantity count is not the same as stocks count!"}
             )
 
+        if len({s["size"] for s in sizes}) != len(sizes):
+            return JsonResponse({"error": "Each size can only be given once!"})
+
         # Delete existing sizes(for edit) of this product
         product_sizes = ProductSize.objects.filter(product=product)
         for product_size in product_sizes:
@@ -248,10 +328,14 @@ def add_product_sizes(request, product_id):
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def get_available_sizes(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    sizes = ProductSize.objects.filter(product=product, available_quantity__gt=0)
-    serializer = ProductSizeSerializer(sizes, many=True)
-    return Response(serializer.data)
+    def build():
+        product = get_object_or_404(Product, id=product_id)
+        sizes = ProductSize.objects.filter(product=product, available_quantity__gt=0)
+        sizes = ProductSizeSerializer.setup_eager_loading(sizes)
+        serializer = ProductSizeSerializer(sizes, many=True)
+        return Response(serializer.data)
+
+    return conditional.respond(request, [f"product:{product_id}"], build)
 
 
 @api_view(["GET"])
@@ -263,10 +347,54 @@ def get_size_specific_stock(request, product_id, size):
     return Response(stock)
 
 
+# Stock of every size of one or many products (?ids=1,2,3) as {product id: {size: quantity}}, in one query. The ETag
+# comes from the products' cache versions, which change with their stock, so polling with If-None-Match gets a 304
+# without touching the database while nothing changed.
+@query_budget(1)
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def get_availability(request):
+    try:
+        product_ids = sorted({int(product_id) for product_id in request.query_params["ids"].split(",")})
+    except (KeyError, ValueError):
+        return Response(
+            {"error": "ids must be product ids separated by commas."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(product_ids) > 100:
+        return Response(
+            {"error": "At most 100 products can be checked at once."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    versions = get_product_versions(product_ids)
+    etag = '"{}"'.format(
+        hashlib.md5(
+            ",".join(f"{product_id}:{versions.get(product_id)}" for product_id in product_ids).encode()
+        ).hexdigest()
+    )
+    if conditional.etag_matches(request.headers.get("If-None-Match", ""), etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response["ETag"] = etag
+        return response
+
+    availability = {product_id: {} for product_id in product_ids}
+    for product_id, size, quantity in ProductSize.objects.filter(
+        product_id__in=product_ids
+    ).values_list("product_id", "size", "available_quantity"):
+        availability[product_id][size] = quantity
+
+    response = Response({"availability": availability})
+    response["ETag"] = etag
+    return response
+
+
 # Simple JWT
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
@@ -278,6 +406,7 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token["last_name"] = user.last_name
         token["is_moderator"] = user.is_moderator
         token["is_admin"] = user.is_admin
+        token["claims_version"] = user.claims_version
 
         return token
 
@@ -299,10 +428,6 @@ def register_user(request):
         password = serializer.validated_data["password"]
 
         username = f"{first_name.lower()}.{last_name.lower()}"
-        num = 1
-        while User.objects.filter(username=username).exists():
-            username = f"{first_name.lower()}.{last_name.lower()}.{num}"
-            num += 1
 
         if len(password) < 8:
             return Response(
@@ -315,8 +440,9 @@ def register_user(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        User.objects.create_user(
-            username=username,
+        # Taken usernames get the next free suffix: name.surname, name.surname.1, name.surname.2...
+        User.objects.create_user_with_free_username(
+            username,
             first_name=first_name,
             last_name=last_name,
             email=email,
@@ -346,37 +472,22 @@ def register_user(request):
 # TODO: Add more security layers to this..(the ones chatGPT mentioned.)
 
 
-# This is for production. Won't work in development since i'll have to provide a valid domain.
-# TODO: send email to the customer with more details n links of the order, when the order is shipped or delivered.
-def send_email(first_name, last_name, to, subject, text):
-    def send_simple_message():
-        print("sending email")
-        return requests.post(
-            "https://api.mailgun.net/v3/sandboxf6d030c564634e419adf8fff551213a2.mailgun.org/messages",
-            auth=("api", "1c07200319baf33aa4844ddd98a67e8f-6b161b0a-74422a83"),
-            data={
-                "from": "Mailgun Sandbox <postmaster@sandboxf6d030c564634e419adf8fff551213a2.mailgun.org>",
-                "to": f"{first_name} {last_name} <{to}>",
-                "subject": subject,
-                "text": text,
-            },
-        )
-
-    send_simple_message()
-
-
 def reduce_quantity_ONLINE(order):
+    # The customer has already paid at this point, so every line that can be reserved is, and the rest are reported.
     order_items = OrderItem.objects.filter(order=order)
-    for item in order_items:
-        product_size = get_object_or_404(
-            ProductSize, product=item.product, size=item.size
+    failed = reduce_stock(
+        [StockLine(item.product_id, item.size, item.quantity) for item in order_items],
+        all_or_nothing=False,
+    )
+    for line in failed:
+        logger.warning(
+            "Order %s was paid but %s items of size %s of product %s are out of stock.",
+            order.id,
+            line.quantity,
+            line.size,
+            line.product_id,
         )
-        product_size.available_quantity -= item.quantity
-        product = item.product
-        product.stock -= item.quantity
-        product.sold += item.quantity
-        product.save()
-        product_size.save()
+    return failed
 
 
 @api_view(["POST"])
@@ -388,14 +499,12 @@ def payment_success(request):
         return HttpResponseBadRequest("Invalid transaction ID")
 
     val_id = request.POST.get("val_id")
-    store_id = os.environ.get("STORE_ID")
-    store_passwd = os.environ.get("STORE_PASSWD")
-
-    # Construct the validation API URL
-    url = f"https://sandbox.sslcommerz.com/validator/api/validationserverAPI.php?val_id={val_id}&store_id={store_id}&store_passwd={store_passwd}&format=json"
-
-    response = requests.get(url, verify=True)
-    response_json = response.json()
+    try:
+        response_json = get_gateway().validate(val_id)
+    except GatewayError:
+        # The payment may well be valid, so the order is kept for the payment to be checked later.
+        logger.warning("Could not validate the payment of order %s.", order.id)
+        return redirect(f"http://localhost:3000/payment-result?status=fail")
 
     if response_json["status"] == "VALID":
         order.online_paid = True
@@ -451,13 +560,6 @@ def get_total(order_data):
 def request_ssl_session(order_data, transaction_id):
     total = get_total(order_data)
 
-    settings = {
-        "store_id": os.environ.get("STORE_ID"),
-        "store_pass": os.environ.get("STORE_PASSWD"),
-        "issandbox": True,
-    }
-
-    sslcz = SSLCOMMERZ(settings)
     post_body = {}
     post_body["total_amount"] = total
     post_body["currency"] = "BDT"
@@ -479,152 +581,95 @@ def request_ssl_session(order_data, transaction_id):
     post_body["product_category"] = "Test Category"
     post_body["product_profile"] = "general"
 
-    return sslcz.createSession(post_body)  # API response
-
-
-# Payment Logic Ends
-
-
-def create_eligible_reviewer(user, product_id, order_id):
-    product = get_object_or_404(Product, id=product_id)
-    order = get_object_or_404(Order, id=order_id)
-
-    if user and product and order:
-        eligible_reviewer = EligibleReviewer.objects.create(
-            user=user, product=product, order=order
-        )
-        eligible_reviewer.save()
-
-
-def is_item_available(item):
-    product = get_object_or_404(Product, id=item["productData"]["id"])
-    quantity = item["quantity"]
-    size = item["size"][0]["size"]
-
-    # check if the productSize is available.
-    product_size = get_object_or_404(ProductSize, product=product, size=size)
-    if product_size.available_quantity >= quantity:
-        return True
-    else:
-        return False
+    return get_gateway().create_session(post_body)  # API response
 
 
-def get_item_unavailable_error_message(item):
-    product = get_object_or_404(Product, id=item["productData"]["id"])
-    size = item["size"][0]["size"]
-    quantity = item["quantity"]
-    product_size = get_object_or_404(ProductSize, product=product, size=size)
-    return f'{quantity} items of size "{size}" of product "{product.name}" is not available. Only {product_size.available_quantity} items are available. Please try again.'
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def payment_gateway_metrics(request):
+    if request.user.is_admin:
+        return Response(get_gateway().get_metrics())
+    return Response({"error": "You are not authorized!"})
 
 
-def reduce_quantity_COD(item):
-    print("reducing quantity COD")
-    product = get_object_or_404(Product, id=item["productData"]["id"])
-    quantity = int(item["quantity"])
-    size = item["size"][0]["size"]
-    product_size = get_object_or_404(ProductSize, product=product, size=size)
-    product_size.available_quantity -= quantity
-    product_size.save()
-    product.stock -= quantity
-    product.sold += quantity
-    product.save()
+# Payment Logic Ends
 
 
+# The same queries whatever the size of the cart (api/checkout.py, api/stock.py), including the sales totals written
+# once the order is committed (api/sales.py).
+@query_budget(25)
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def place_order(request):
-    # I will have to create an Order first and then the order items.
-    # I will have to check if the user is authenticated or not.
+    # The whole cart is loaded and validated before anything is written, then the order and its items are created
+    # in one transaction.
 
     serializer = OrderSerializer(data=request.data["order"])
-    order = None
-    if serializer.is_valid():
-        order = serializer.save()
-        order.shipping_charge = request.data["shipping_charge"]
-        order.payment_method = request.data["payment_method"]
-        total = get_total(request.data)
-        order.total = total
-        order.outside_comilla = request.data["outside_comilla"]
-
-        if (
-            request.data["payment_method"] == "COD"
-            and request.data["outside_comilla"] == True
-        ):
-            return Response(
-                {
-                    "error": "Cash on delivery is not available outside Comilla. Please pay online."
-                },
-            )
-
-        # if payment is online, begin payment logic. else bypass the order for Cash on delivery.
-        if request.data["payment_method"] == "online":
-            transaction_id = uuid.uuid4().hex
-            order.transaction_id = transaction_id
-            order.online_paid = False
-            order.save()
-
-            ssl_response = request_ssl_session(request.data, transaction_id)
-            if not ssl_response["status"] == "SUCCESS":
-                order.delete()
-                return Response(
-                    {"error": "Payment gateway error."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-        elif request.data["payment_method"] == "COD":
-            order.save()
-    else:
+    if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    order_items_array = request.data["order_items"]
+    payment_method = request.data["payment_method"]
+    if payment_method == "COD" and request.data["outside_comilla"] == True:
+        return Response(
+            {
+                "error": "Cash on delivery is not available outside Comilla. Please pay online."
+            },
+        )
 
-    for item in order_items_array:
-        order = get_object_or_404(Order, id=order.id)
-        product = get_object_or_404(Product, id=item["productData"]["id"])
-        quantity = item["quantity"]
-        size = item["size"][0]["size"]
-
-        if request.user.is_authenticated and item["productData"]["id"] and order.id:
-            # Create Eligibe instance
-            create_eligible_reviewer(request.user, item["productData"]["id"], order.id)
-
-        # Get product price from the backend since the user can change the price in the frontend.
-        price = 0
-        if product.discount_price:
-            price = product.discount_price * quantity
-        else:
-            price = product.regular_price * quantity
-
-        if order and product and quantity and size and price:
-            available = is_item_available(item)
-            if not available:
-                order.delete()
-                message = get_item_unavailable_error_message(item)
-                return Response({"error": message})
-
-            try:
-                order_item = OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                    size=size,
-                    price=price,
-                )
-                order_item.save()
+    cart = load_cart(request.data["order_items"])
+    message = cart.unavailable_message()
+    if message:
+        return Response({"error": message})
 
-                if request.data["payment_method"] == "COD":
-                    reduce_quantity_COD(item)
+    # if payment is online, begin payment logic. else bypass the order for Cash on delivery.
+    transaction_id = None
+    if payment_method == "online":
+        transaction_id = uuid.uuid4().hex
+        try:
+            ssl_response = request_ssl_session(request.data, transaction_id)
+        except GatewayUnavailable:
+            return Response(
+                {"error": "Online payment is unavailable right now. Please try again later."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        except GatewayError:
+            ssl_response = {"status": "FAILED"}
+        if not ssl_response["status"] == "SUCCESS":
+            return Response(
+                {"error": "Payment gateway error."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            except IntegrityError:
-                order.delete()
-                return Response(
-                    {"error": "Something went wrong"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+    try:
+        with transaction.atomic():
+            order = serializer.save(
+                shipping_charge=request.data["shipping_charge"],
+                payment_method=payment_method,
+                total=get_total(request.data),
+                outside_comilla=request.data["outside_comilla"],
+                transaction_id=transaction_id,
+                online_paid=False,
+            )
+            create_order_items(
+                order,
+                cart,
+                user=request.user if request.user.is_authenticated else None,
+                reduce_quantity=payment_method == "COD",
+            )
+    except InsufficientStock:
+        # Someone else bought the last items between validating the cart and writing the order.
+        message = load_cart(request.data["order_items"]).unavailable_message()
+        return Response({"error": message or "Some items are out of stock."})
+    except IntegrityError:
+        return Response(
+            {"error": "Something went wrong"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    if request.data["payment_method"] == "online":
+    if payment_method == "online":
         return Response(ssl_response, status=status.HTTP_201_CREATED)
 
-    if request.data["payment_method"] == "COD":
+    if payment_method == "COD":
         send_email(
             order.first_name,
             order.last_name,
@@ -670,27 +715,27 @@ def edit_account(request, id):
 
 class SearchList(generics.ListCreateAPIView):
     serializer_class = ProductSerializer
+    query_budget = 5
 
-    def get_queryset(self):
-        query = self.request.query_params.get("query", None)
-        if query:
-            qs = Product.objects.filter(
-                Q(name__icontains=query)
-                | Q(description__icontains=query)
-                | Q(category__name__icontains=query)
-            ).order_by("-id")
-            return qs
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get("query", None)
+        if not query:
+            return Response(
+                {"error": "No query was provided!"}, status=status.HTTP_400_BAD_REQUEST
+            )
 
-        return Response(
-            {"error": "No query was provided!"}, status=status.HTTP_400_BAD_REQUEST
-        )
+        # The search index gives the ranked ids, the products on the requested page come from the fragment cache.
+        ids = search_product_ids(query)
+        page = self.paginate_queryset(ids)
+        return self.get_paginated_response(serialize_products(page, request))
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_wishlist_items(request):
     user = request.user
-    qs = WishList.objects.filter(user=user).order_by("-id")
+    qs = WishList.objects.filter(user_id=user.id).order_by("-id")
+    qs = WishListSerializer.setup_eager_loading(qs)
     serializer = WishListSerializer(qs, many=True)
     return Response(serializer.data)
 
@@ -700,40 +745,113 @@ def get_wishlist_items(request):
 def if_in_wishlist(request, slug):
     user = request.user
     product = get_object_or_404(Product, slug=slug)
-    qs = WishList.objects.filter(user=user, product=product)
+    qs = WishList.objects.filter(user_id=user.id, product=product)
     if qs.exists():
         return Response({"message": True}, status=status.HTTP_200_OK)
     else:
         return Response({"message": False}, status=status.HTTP_200_OK)
 
 
+# Membership of a whole product grid in one request and one query: ?ids=1,2,3 or ?slugs=a,b,c.
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def wishlist_membership(request):
+    user = request.user
+    ids = request.query_params.get("ids")
+    slugs = request.query_params.get("slugs")
+    if ids:
+        try:
+            keys = [int(product_id) for product_id in ids.split(",")]
+        except ValueError:
+            return Response(
+                {"error": "ids must be product ids separated by commas."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        lookup = "product_id"
+    elif slugs:
+        keys = slugs.split(",")
+        lookup = "product__slug"
+    else:
+        return Response(
+            {"error": "No ids or slugs were provided!"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if len(keys) > 100:
+        return Response(
+            {"error": "At most 100 products can be checked at once."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    found = set(
+        WishList.objects.filter(user_id=user.id, **{f"{lookup}__in": keys}).values_list(
+            lookup, flat=True
+        )
+    )
+    return Response({"wishlist": {key: key in found for key in keys}})
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def change_wishlist(request, slug):
+    # Toggle. Deleting first tells whether it was there, the unique (user, product) constraint keeps a concurrent
+    # toggle from adding it twice.
     user = request.user
     product = get_object_or_404(Product, slug=slug)
-    qs = WishList.objects.filter(user=user, product=product)
-    if qs.exists():
-        qs.delete()
+    deleted, _ = WishList.objects.filter(user_id=user.id, product=product).delete()
+    if deleted:
         return Response(
             {"message": "Product removed from wishlist!"}, status=status.HTTP_200_OK
         )
     else:
-        WishList.objects.create(user=user, product=product)
+        WishList.objects.bulk_create(
+            [WishList(user_id=user.id, product=product)], ignore_conflicts=True
+        )
         return Response(
             {"message": "Product added to wishlist!"}, status=status.HTTP_201_CREATED
         )
 
 
-class QnAList(generics.ListCreateAPIView):
+# Idempotent versions of the toggle: PUT adds the product, DELETE removes it, repeating either changes nothing.
+@api_view(["PUT", "DELETE"])
+@permission_classes([IsAuthenticated])
+def wishlist_item(request, product_id):
+    user = request.user
+    if request.method == "PUT":
+        if not Product.objects.filter(id=product_id).exists():
+            return Response(
+                {"error": "Product not found!"}, status=status.HTTP_404_NOT_FOUND
+            )
+        WishList.objects.bulk_create(
+            [WishList(user_id=user.id, product_id=product_id)], ignore_conflicts=True
+        )
+        return Response({"message": "Product added to wishlist!"})
+
+    WishList.objects.filter(user_id=user.id, product_id=product_id).delete()
+    return Response({"message": "Product removed from wishlist!"})
+
+
+class QnAList(EagerLoadingMixin, generics.ListCreateAPIView):
     serializer_class = QnASerializer
+    query_budget = 5
 
     def get_queryset(self):
         slug = self.kwargs["slug"]
 
         user = self.request.user
         if user.is_authenticated and (user.is_moderator or user.is_admin):
-            qs = QnA.objects.filter(product__slug=slug).order_by("answer", "-id")
+            # Unanswered questions first.
+            qs = (
+                QnA.objects.filter(product__slug=slug)
+                .annotate(
+                    answer_rank=Case(
+                        When(Q(answer=None) | Q(answer=""), then=Value("A")),
+                        default=Value("B"),
+                        output_field=CharField(),
+                    )
+                )
+                .order_by("answer_rank", "-id")
+            )
             return qs
 
         qs = (
@@ -769,9 +887,12 @@ def add_answer(request, qna_id):
     if user.is_admin or user.is_moderator:
         answer = request.data["answer"]
         if answer:
-            qna = get_object_or_404(QnA, id=qna_id)
-            qna.answer = answer
-            qna.save()
+            qna = get_object_or_404(QnA.objects.select_related("user", "product"), id=qna_id)
+            if not moderation.answer(qna, user, answer):
+                return Response(
+                    {"error": "Another moderator is answering this question!"},
+                    status=status.HTTP_409_CONFLICT,
+                )
             return Response(
                 {"message": "Answer added successfully!"},
                 status=status.HTTP_201_CREATED,
@@ -787,8 +908,77 @@ def add_answer(request, qna_id):
         )
 
 
-class UnansweredList(generics.ListAPIView):
+# Moderator question queue (see api/moderation.py). GET gives the number of unanswered questions.
+@query_budget(1)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def qna_queue(request):
+    user = request.user
+    if not (user.is_moderator or user.is_admin):
+        raise PermissionDenied("You are not authorized to take this action!")
+    return Response({"unanswered": moderation.get_unanswered_count()})
+
+
+# Claims up to {"size": n} of the oldest unanswered questions nobody else is answering, for QNA_LEASE seconds.
+@query_budget(4)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def claim_questions(request):
+    user = request.user
+    if not (user.is_moderator or user.is_admin):
+        raise PermissionDenied("You are not authorized to take this action!")
+
+    try:
+        size = int(request.data["size"]) if request.data.get("size") else None
+    except (TypeError, ValueError):
+        return Response({"error": "Invalid size!"}, status=status.HTTP_400_BAD_REQUEST)
+
+    questions, until = moderation.claim(user, size)
+    questions = QnASerializer.setup_eager_loading(questions)
+    return Response(
+        {
+            "claimed_until": until,
+            "results": QnASerializer(questions, many=True).data,
+            "unanswered": moderation.get_unanswered_count(),
+        }
+    )
+
+
+# {"answers": [{"id": <qna id>, "answer": "..."}, ...]} answers the questions this moderator holds. With
+# {"release": [<qna id>, ...]} (or "release": "all"), gives questions back to the queue.
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def answer_questions(request):
+    user = request.user
+    if not (user.is_moderator or user.is_admin):
+        raise PermissionDenied("You are not authorized to take this action!")
+
+    try:
+        answers = {
+            int(item["id"]): item["answer"]
+            for item in request.data.get("answers", [])
+            if item.get("answer")
+        }
+        release = request.data.get("release", [])
+        release_ids = None if release == "all" else [int(qna_id) for qna_id in release]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return Response({"error": "Invalid answers!"}, status=status.HTTP_400_BAD_REQUEST)
+
+    answered = moderation.answer_claimed(user, answers) if answers else []
+    released = moderation.release(user, release_ids) if release else 0
+    return Response(
+        {
+            "answered": answered,
+            "skipped": [qna_id for qna_id in answers if qna_id not in answered],
+            "released": released,
+            "unanswered": moderation.get_unanswered_count(),
+        }
+    )
+
+
+class UnansweredList(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = QnASerializer
+    query_budget = 5
 
     @permission_classes([IsAuthenticated])
     def get_queryset(self):
@@ -798,9 +988,6 @@ class UnansweredList(generics.ListAPIView):
                 qs = QnA.objects.filter(
                     Q(answer__exact=None) | Q(answer__exact="")
                 ).order_by("id")
-
-                # TODO: Send email to the user who asked the question.
-
                 return qs
             return Response(
                 {"error": "You are not authorized to perform this action!"},
@@ -814,21 +1001,15 @@ class UnansweredList(generics.ListAPIView):
 
 class OrderList(generics.ListAPIView):
     serializer_class = OrderSerializer
+    query_budget = 5
 
     @permission_classes([IsAuthenticated])
     def get_queryset(self):
         user = self.request.user
         if user.is_authenticated:
             if user.is_admin or user.is_moderator:
-                qs = Order.objects.all().order_by(
-                    Case(
-                        When(status="Pending", then=Value("A")),
-                        default=Value("B"),
-                        output_field=CharField(),
-                    ),
-                    "-id",
-                )
-                return qs
+                # Pending orders first, read in order from order_pending_idx.
+                return Order.objects.order_by("-pending", "-id")
 
             raise PermissionDenied(
                 detail="You are not authorized to perform this action."
@@ -840,10 +1021,80 @@ class OrderList(generics.ListAPIView):
 @api_view(["GET"])
 def get_order_items(request, order_id):
     qs = OrderItem.objects.filter(order__id=order_id)
+    qs = OrderItemSerializer.setup_eager_loading(qs)
     serializer = OrderItemSerializer(qs, many=True)
     return Response(serializer.data)
 
 
+# Streams every order matching ?from=YYYY-MM-DD&to=YYYY-MM-DD&status=<status> with its items, as CSV or, with
+# ?output=jsonl, JSON lines (see api/exports.py). ("format" is taken by DRF.)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_orders(request):
+    if not request.user.is_admin:
+        raise PermissionDenied("You are not authorized to take this action!")
+
+    output = request.query_params.get("output", "csv")
+    if output not in exports.FORMATS:
+        return Response({"error": "Unknown output format!"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        date_from = exports.parse_day(request.query_params.get("from"))
+        date_to = exports.parse_day(request.query_params.get("to"))
+    except ValueError:
+        return Response(
+            {"error": "Dates must be written YYYY-MM-DD!"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    orders = exports.get_orders(date_from, date_to, request.query_params.get("status"))
+    write, content_type = exports.FORMATS[output]
+    response = StreamingHttpResponse(write(exports.export_orders(orders)), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="orders.{output}"'
+    return response
+
+
+# Units and revenue per ?by=day|product|category (default day) between ?from and ?to (YYYY-MM-DD, the last 30 days
+# by default), optionally only for ?category=<slug> or ?product=<id>. Read from the daily totals (see api/sales.py).
+@query_budget(1)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def get_sales(request):
+    if not request.user.is_admin:
+        raise PermissionDenied("You are not authorized to take this action!")
+
+    group_by = request.query_params.get("by", "day")
+    if group_by not in ["day", "product", "category"]:
+        return Response({"error": "Unknown grouping!"}, status=status.HTTP_400_BAD_REQUEST)
+    date_from, date_to = sales.get_default_range()
+    try:
+        date_from = exports.parse_day(request.query_params.get("from")) or date_from
+        date_to = exports.parse_day(request.query_params.get("to")) or date_to
+        product_id = int(request.query_params.get("product") or 0) or None
+        limit = min(int(request.query_params.get("limit", 50)), 500)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError:
+        return Response({"error": "Invalid parameters!"}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = sales.get_report(
+        date_from,
+        date_to,
+        group_by,
+        category=request.query_params.get("category"),
+        product_id=product_id,
+        limit=limit,
+    )
+    return Response(
+        {
+            "from": date_from,
+            "to": date_to,
+            "by": group_by,
+            "results": rows,
+            "units": sum(row["units"] for row in rows),
+            "revenue": sum(row["revenue"] for row in rows),
+        }
+    )
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def change_order_status(request, id):
@@ -855,7 +1106,13 @@ def change_order_status(request, id):
                 order = get_object_or_404(Order, id=id)
                 order.status = status
                 order.save()
-                # TODO: Send email to the user about the status change.
+                send_email(
+                    order.first_name,
+                    order.last_name,
+                    order.email,
+                    "Order status updated",
+                    f"The status of your order #{order.id} is now: {status}. Please visit the website to view your order details.",
+                )
                 return Response({"message": "Order status changed successfully!"})
             else:
                 return Response({"error": "No status found!"})
@@ -865,11 +1122,12 @@ def change_order_status(request, id):
     return Response({"error": "You are not authenticated!"})
 
 
+# ?category=<slug> for the new arrivals of one category.
+@query_budget(2)
 @api_view(["GET"])
 def new_arrivals(request):
-    qs = Product.objects.all().order_by("-id")[:12]
-    serializer = ProductSerializer(qs, many=True)
-    return Response(serializer.data)
+    ids = leaderboards.get_product_ids("new", request.query_params.get("category"))
+    return Response(serialize_products(ids, request))
 
 
 # track orders
@@ -880,9 +1138,12 @@ def new_arrivals(request):
 def get_user_orders(request):
     user = request.user
     if user.is_authenticated:
-        qs = Order.objects.filter(username=user.username).order_by("-id")
-        serializer = OrderSerializer(qs, many=True)
-        return Response(serializer.data)
+        def build():
+            qs = Order.objects.filter(username=user.username).order_by("-id")
+            serializer = OrderSerializer(qs, many=True)
+            return Response(serializer.data)
+
+        return conditional.respond(request, [f"orders:{user.username}"], build)
     else:
         return Response({"error": "You are not authenticated!"})
 
@@ -958,11 +1219,12 @@ def edit_product(request, slug):
     return Response({"error": "You are not authorized!"})
 
 
+# ?category=<slug> for the best sellers of one category.
+@query_budget(2)
 @api_view(["GET"])
 def get_top_products(request):
-    qs = Product.objects.all().order_by("-sold")[:12]
-    serializer = ProductSerializer(qs, many=True)
-    return Response(serializer.data)
+    ids = leaderboards.get_product_ids("top", request.query_params.get("category"))
+    return Response(serialize_products(ids, request))
 
 
 # Delete product